@@ -0,0 +1,283 @@
+"""Seeded benchmarks for every solver path.
+
+    python benchmark.py                   # run all cases, compare with the baseline
+    python benchmark.py --save-baseline   # run and store the numbers as the new baseline
+    python benchmark.py -k main          # only cases whose name contains "main"
+    python benchmark.py --baseline local.json --save-baseline --timings
+
+Each (case, seed) runs in a fresh process, so peak memory is that run's
+alone. Per case the median over seeds is reported for runs/sec, time to
+the first run with nothing unplaced, time to the first with nothing
+unplaced and no gaps, peak RSS and final score (in the path's own
+units). Scores are seeded and comparable anywhere, so the committed
+baseline holds only those (and, for cases cut off by the clock, only the
+unplaced count). Timings hold for the machine they were measured on:
+keep them in a baseline of your own, saved with --timings. A missing
+baseline is an error, so CI cannot pass without comparing.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+try:
+    import resource
+except ImportError:     # not on Windows
+    resource = None
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BACKEND = os.path.join(HERE, '..', 'timetable-backend')
+BASELINE = os.path.join(HERE, 'benchmark_baseline.json')
+sys.path[:0] = [HERE, BACKEND]
+
+import fixtures
+import synthetic
+
+# ==========================================
+# 1. CASES
+# ==========================================
+
+class Clock:
+    """Times the first feasible and first zero-gap solution of one run."""
+    def __init__(self):
+        self.started = time.time()
+        self.first_feasible = None
+        self.zero_gap = None
+
+    def saw(self, unplaced, gaps):
+        t = time.time() - self.started
+        if unplaced == 0 and self.first_feasible is None: self.first_feasible = t
+        if unplaced == 0 and gaps == 0 and self.zero_gap is None: self.zero_gap = t
+
+    def placed_at(self, at):
+        # A fully placed run need not be the best so far
+        t = at - self.started
+        if self.first_feasible is None or t < self.first_feasible: self.first_feasible = t
+
+    def metrics(self, runs, score, unplaced, gaps, run_seconds=None):
+        elapsed = time.time() - self.started
+        if run_seconds is None: run_seconds = elapsed
+        return {
+            "runs": runs, "elapsed_s": round(elapsed, 3),
+            "runs_per_sec": round(runs / run_seconds, 2) if run_seconds > 0 else 0.0,
+            "ttff_s": _round(self.first_feasible), "zero_gap_s": _round(self.zero_gap),
+            "score": score, "unplaced": unplaced, "gaps": gaps
+        }
+
+def _round(x):
+    return None if x is None else round(x, 3)
+
+def bench_main(seed, years=None, scale=None, **solver):
+    # ``scale`` swaps the dataset for a synthetic institution; the instance
+    # stays fixed and only the solver seed varies.
+    import main
+    clock = Clock()
+
+    class Recorder(main.SolveProgress):
+        last_run = None
+
+        def runs_done(self, n):
+            super().runs_done(n)
+            self.last_run = time.time()
+
+        def fully_placed(self, at):
+            super().fully_placed(at)
+            clock.placed_at(at)
+
+        def improved(self, result):
+            super().improved(result)
+            clock.saw(len(result.unplaced), result.gaps)
+
+    body = synthetic.synthetic_request(**scale) if scale else fixtures.dataset_request(years)
+    req = main.TimetableRequest(**body)
+    progress = Recorder()
+    main.solve(main.compile_problem(req), main.SolverOptions(seed=seed, **solver), progress)
+    best = progress.best
+    # Restarts and local search are rated separately
+    run_seconds = progress.last_run - clock.started
+    metrics = clock.metrics(progress.runs, best.score, len(best.unplaced), best.gaps, run_seconds)
+    if progress.moves:
+        metrics["moves_per_sec"] = round(progress.moves / max(1e-9, time.time() - progress.last_run), 1)
+    return metrics
+
+def timetable_gaps(timetable, recess):
+    """Free periods between a division's first and last session of a day."""
+    gaps = 0
+    for week in timetable.values():
+        for entries in week.values():
+            busy = {s for e in entries for s in range(e['slot'], e['slot'] + e['duration'])}
+            if not busy: continue
+            lo, hi = min(busy), max(busy)
+            gaps += max(0, hi - lo + 1 - len(busy) - (1 if lo < recess < hi else 0))
+    return gaps
+
+def bench_algorithm(seed, passes=20):
+    # algorithm.py is a single greedy pass; its "runs" are repeated requests.
+    import algorithm
+    payload = fixtures.algorithm_request()
+    req = algorithm.TimetableRequest(**payload)
+    sessions = 0
+    for year, divs in payload['divisions'].items():
+        subs = payload['subjects'].get(year, [])
+        per_div = sum(s['weekly_load'] for s in subs if s['type'] == 'Theory')
+        per_div += len([s for s in subs if s['type'] == 'Lab'])
+        sessions += per_div * len(divs)
+
+    random.seed(seed)
+    clock = Clock()
+    best = None
+    for _ in range(passes):
+        out = asyncio.run(algorithm.generate_timetable(req))
+        unplaced = sessions - sum(len(e) for week in out.values() for e in week.values())
+        gaps = timetable_gaps(out, payload['config']['recess_index'])
+        clock.saw(unplaced, gaps)
+        if best is None or (unplaced, gaps) < best: best = (unplaced, gaps)
+    return clock.metrics(passes, -(best[0] * 100 + best[1]), *best)
+
+def bench_timetable_gen(seed, iterations=200):
+    import timetable_gen
+    random.seed(seed)
+    clock = Clock()
+    state = {"runs": 0, "best": None}
+
+    def on_run(run, score, unplaced, gaps):
+        state["runs"] += 1
+        if state["best"] is None or score > state["best"][0]: state["best"] = (score, unplaced, gaps)
+        clock.saw(unplaced, gaps)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        timetable_gen.run_solver(iterations, on_run=on_run)
+    return clock.metrics(state["runs"], *state["best"])
+
+CASES = {
+    "main.restarts": (bench_main, {"max_runs": 200}),
+    "main.restarts.se": (bench_main, {"years": ["SE"], "max_runs": 200}),
+    "main.anneal": (bench_main, {"max_runs": 50, "improve": "anneal", "improve_seconds": 8}),
+    "main.tabu": (bench_main, {"max_runs": 50, "improve": "tabu", "improve_seconds": 8}),
+    "main.synthetic.x2": (bench_main, {"scale": {"departments": 2}, "max_runs": 100}),
+    "main.synthetic.x4": (bench_main, {"scale": {"departments": 4}, "max_runs": 50}),
+    "algorithm": (bench_algorithm, {"passes": 20}),
+    "timetable_gen": (bench_timetable_gen, {"iterations": 200}),
+}
+
+# Cases whose final score depends on how far the clock let the search get
+TIMED = {"main.anneal", "main.tabu"}
+
+# ==========================================
+# 2. RUNNER
+# ==========================================
+
+def _run_case(name, seed):
+    logging.disable(logging.INFO)
+    fn, kwargs = CASES[name]
+    metrics = fn(seed, **kwargs)
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        metrics["peak_rss_mb"] = round(peak / (1 << 20 if sys.platform == "darwin" else 1 << 10), 1)
+    return metrics
+
+def run_case(name, seeds):
+    ctx = multiprocessing.get_context("spawn")
+    per_seed = []
+    for seed in seeds:
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+            per_seed.append(pool.submit(_run_case, name, seed).result())
+    summary = {}
+    for key in per_seed[0]:
+        values = [m[key] for m in per_seed if m.get(key) is not None]
+        # A milestone some seeds never reached counts as not reached
+        if len(values) < len(per_seed): summary[key] = None
+        else: summary[key] = statistics.median(values)
+    summary["seeds"] = list(seeds)
+    return summary
+
+# ==========================================
+# 3. BASELINE
+# ==========================================
+
+# metric -> True when higher is better
+DIRECTIONS = {"runs_per_sec": True, "moves_per_sec": True, "ttff_s": False, "zero_gap_s": False, "peak_rss_mb": False,
+              "score": True, "unplaced": False, "gaps": False}
+EXACT = {"score", "unplaced", "gaps"}   # seeded, so any change for the worse counts
+
+def portable(name, result):
+    """The part of a case's result that holds on any machine."""
+    keys = ["unplaced"] if name in TIMED else ["score", "unplaced", "gaps"]
+    return {k: result[k] for k in keys + ["seeds"] if k in result}
+
+def regressions(name, current, baseline, tolerance):
+    found = []
+    for key, higher_is_better in DIRECTIONS.items():
+        old, new = baseline.get(key), current.get(key)
+        if old is None: continue
+        if new is None:
+            found.append(f"{name}: {key} not reached (baseline {old})")
+        elif key in EXACT:
+            if (new < old) if higher_is_better else (new > old):
+                found.append(f"{name}: {key} {new} {'<' if higher_is_better else '>'} baseline {old}")
+        elif higher_is_better and new < old * (1 - tolerance):
+            found.append(f"{name}: {key} {new} < baseline {old}")
+        elif not higher_is_better and new > old * (1 + tolerance):
+            found.append(f"{name}: {key} {new} > baseline {old}")
+    return found
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the timetable solvers")
+    parser.add_argument("-k", dest="pattern", default="", help="only cases whose name contains this")
+    parser.add_argument("--seeds", default="1,2,3")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--timings", action="store_true", help="store timings too (machine-specific baselines only)")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown/growth, as a fraction")
+    parser.add_argument("--json", help="also write the results here")
+    args = parser.parse_args()
+
+    seeds = [int(s) for s in args.seeds.split(",")]
+    results = {}
+    for name in CASES:
+        if args.pattern not in name: continue
+        results[name] = run_case(name, seeds)
+        r = results[name]
+        print(f"{name:18} runs/s {r['runs_per_sec']:>8}  ttff {str(r['ttff_s']):>7}  zero-gap {str(r['zero_gap_s']):>7}"
+              f"  rss {str(r.get('peak_rss_mb')):>6}MB  score {r['score']} (unplaced {r['unplaced']}, gaps {r['gaps']})"
+              + (f"  moves/s {r['moves_per_sec']}" if "moves_per_sec" in r else ""),
+              flush=True)
+
+    if args.json:
+        with open(args.json, "w") as f: json.dump(results, f, indent=2)
+    if args.save_baseline:
+        stored = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f: stored = json.load(f)
+        stored.update(results if args.timings else {n: portable(n, r) for n, r in results.items()})
+        with open(args.baseline, "w") as f: json.dump(stored, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline to store one.")
+        return 1
+
+    with open(args.baseline) as f: baseline = json.load(f)
+    found = []
+    for name, current in results.items():
+        if name not in baseline:
+            found.append(f"{name}: not in the baseline")
+        elif baseline[name].get("seeds") not in (None, current["seeds"]):
+            found.append(f"{name}: baseline is for seeds {baseline[name]['seeds']}, ran {current['seeds']}")
+        else:
+            found += regressions(name, current, baseline[name], args.tolerance)
+    for line in found: print("REGRESSION", line)
+    if not found: print("No regressions against the baseline.")
+    return 1 if found else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
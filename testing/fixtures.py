@@ -0,0 +1,82 @@
+import copy
+
+import timetable_gen as tg
+
+# ==========================================
+# Request payloads built from the timetable_gen dataset
+# ==========================================
+#
+# THEORY_DATA / ELECTIVE_DATA / LAB_TASKS describe the department the
+# standalone generator was tuned on. These helpers turn them into request
+# bodies for the two backends, so every solver path is measured on the
+# same department.
+
+DIVISIONS = {'SE': ['SE-A', 'SE-B', 'SE-C'], 'TE': ['TE-A', 'TE-B'], 'BE': ['BE-A', 'BE-B']}
+SHIFTS = ['A', 'B', 'C']    # C is unrestricted
+
+def _faculty():
+    return [dict(id=tid, name=name, role='Faculty', experience=5, shift=SHIFTS[i % 3], skills=[])
+            for i, (tid, name) in enumerate(tg.ALL_TEACHERS.items())]
+
+def dataset_request(years=None):
+    """A main.py TimetableRequest body (as a dict) for the dataset, optionally
+    limited to some years."""
+    subjects = {year: [] for year in DIVISIONS}
+    seen = set()
+    def add(year, name, type, load, duration=1):
+        if (year, name) in seen: return
+        seen.add((year, name))
+        subjects[year].append(dict(name=name, code=name[:4].upper(), type=type, weekly_load=load, duration=duration))
+
+    allocations = []
+    for tid, subject, divs, count in tg.THEORY_DATA:
+        for div in divs:
+            add(div[:2], subject, 'Theory', count)
+            allocations.append(dict(teacher_id=tid, subject_name=subject, division=div))
+    for s1, t1, s2, t2, divs, count in tg.ELECTIVE_DATA:
+        for div in divs:
+            add(div[:2], s1, 'Elective', count)
+            add(div[:2], s2, 'Elective', count)
+            allocations.append(dict(teacher_id=t1, subject_name=s1, division=div))
+            allocations.append(dict(teacher_id=t2, subject_name=s2, division=div))
+    for div, batches, subject, tid in tg.LAB_TASKS:
+        add(div[:2], subject, 'Lab', 2, 2)
+        for b in batches:
+            allocations.append(dict(teacher_id=tid, subject_name=subject, division=f"{div}-{b}"))
+    for div in DIVISIONS['SE']:
+        add('SE', 'Maths Tut', 'Tutorial', 1)
+        for n in '123':
+            allocations.append(dict(teacher_id='T22', subject_name='Maths Tut', division=f"{div}-{div[-1]}{n}"))
+
+    consts = tg.CONSTANTS
+    request = dict(
+        config=dict(slots_per_day=len(consts['SLOTS']), recess_index=consts['RECESS_INDEX'], days=consts['DAYS']),
+        resources=dict(lab_rooms=consts['LAB_ROOMS'] + [consts['MATHS_LAB']], theory_rooms=consts['THEORY_ROOMS']),
+        subjects=subjects, lab_prefs={}, home_rooms=dict(tg.HOME_ROOMS),
+        faculty=_faculty(), allocations=allocations, divisions=copy.deepcopy(DIVISIONS),
+        rooms=[dict(name=r, type='Classroom') for r in consts['THEORY_ROOMS']]
+              + [dict(name=r, type='Lab') for r in consts['LAB_ROOMS']]
+              + [dict(name=consts['MATHS_LAB'], type='Lab', special_assignment='Maths')]
+    )
+    if years is not None:
+        request['divisions'] = {y: d for y, d in request['divisions'].items() if y in years}
+        request['subjects'] = {y: s for y, s in request['subjects'].items() if y in years}
+        request['allocations'] = [a for a in allocations if a['division'][:2] in years]
+        request['home_rooms'] = {d: r for d, r in request['home_rooms'].items() if d[:2] in years}
+    return request
+
+def algorithm_request():
+    """The same department in algorithm.py's schema. It has no electives or
+    tutorials, so those are left out."""
+    request = dataset_request()
+    subjects = {year: [dict(name=s['name'], code=s['code'], type=s['type'], weekly_load=s['weekly_load'])
+                       for s in subs if s['type'] in ('Theory', 'Lab')]
+                for year, subs in request['subjects'].items()}
+    config = request['config']
+    return dict(
+        config=dict(slots_per_day=config['slots_per_day'], recess_index=config['recess_index'], days=config['days']),
+        resources=dict(request['resources']), subjects=subjects, lab_prefs={},
+        home_rooms=request['home_rooms'], faculty=request['faculty'],
+        allocations=[a for a in request['allocations'] if a['division'] in sum(DIVISIONS.values(), [])],
+        divisions=request['divisions']
+    )
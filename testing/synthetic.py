@@ -0,0 +1,191 @@
+"""Synthetic institutions at any scale, as main.py TimetableRequest JSON.
+
+    python synthetic.py --departments 6 --divisions 4 --seed 7 -o big.json
+    python synthetic.py --departments 2 --density 0.9 --teachers 40
+
+Every department gets the same shape: ``years`` years of ``divisions``
+divisions, each split into ``batches`` lab batches. A division's week is
+filled to ``density`` of its teaching slots with lab rotations (every
+batch does every lab subject once, two hours, batches in parallel), an
+elective pair, a tutorial in the first year, and theory subjects for the
+rest. ``special_labs`` lab subjects per department need their own
+reserved room. Teachers and rooms default to roughly what the load
+needs; pass them explicitly to squeeze the instance. The same arguments
+and seed always produce the same request.
+"""
+import argparse
+import json
+import math
+import random
+import string
+import sys
+
+DEPARTMENTS = ['IT', 'CS', 'EX', 'ME', 'CE', 'CH', 'EE', 'IN']
+YEARS = ['FE', 'SE', 'TE', 'BE']
+DAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri']
+SLOTS_PER_DAY = 9
+RECESS_INDEX = 4        # main.py fixes the recess at slot 4
+
+TEACHER_HOURS = 14      # target weekly load when the teacher count is left to us
+ROOM_USE = 0.7          # target share of a room's week in use when sizing pools
+ELECTIVE_LOAD = 3
+
+def _names(prefixes, n):
+    return prefixes[:n] + [f"{prefixes[0][0]}{i}" for i in range(len(prefixes), n)]
+
+def synthetic_request(seed=0, departments=1, years=3, divisions=3, batches=3, labs=None,
+                      special_labs=1, density=0.8, teachers=None, theory_rooms=None, lab_rooms=None):
+    """A TimetableRequest body (as a dict) for a synthetic institution.
+
+    ``labs`` is the number of lab subjects per year (default ``batches``, so
+    the rotation fills every session). ``teachers``, ``theory_rooms`` and
+    ``lab_rooms`` are institution-wide totals.
+    """
+    if divisions > 26: raise ValueError("at most 26 divisions per year")
+    if special_labs > 26: raise ValueError("at most 26 special labs per department")
+    rng = random.Random(seed)
+    labs = batches if labs is None else labs
+    week = len(DAYS) * (SLOTS_PER_DAY - 1)
+    target = round(density * week)
+
+    subjects, divs_by_year, demands = {}, {}, []    # demands: (dept, hours, [allocations], teachers needed)
+    special_keys, special_hours = [], {}
+    for dept in _names(DEPARTMENTS, departments):
+        keys = [f"{dept} Special Lab {c}" for c in string.ascii_uppercase[:special_labs]]
+        special_keys += keys
+        for y, year in enumerate(_names(YEARS, years)):
+            year_key = f"{dept}{year}"
+            divs = [f"{year_key}-{c}" for c in string.ascii_uppercase[:divisions]]
+            divs_by_year[year_key] = divs
+            subs = subjects[year_key] = []
+
+            # Special labs go to one year each, round-robin
+            lab_names = [k + f" {year}" for i, k in enumerate(keys) if i % years == y][:labs]
+            lab_names += [f"{year_key} Lab {i + 1}" for i in range(labs - len(lab_names))]
+            for name in lab_names:
+                subs.append(dict(name=name, code=name[-6:].replace(' ', '').upper(), type='Lab', weekly_load=2, duration=2))
+            # Batches beyond the lab count need a second rotation
+            used = 2 * labs * math.ceil(batches / max(1, labs))
+
+            elective = [f"{year_key} Elective {c}" for c in 'XY']
+            for name in elective:
+                subs.append(dict(name=name, code=name[-10:].replace(' ', '').upper(), type='Elective', weekly_load=ELECTIVE_LOAD))
+            used += ELECTIVE_LOAD
+
+            tutorial = None
+            if y == 0:
+                tutorial = f"{year_key} Maths Tut"
+                subs.append(dict(name=tutorial, code=f"{year_key}TUT", type='Tutorial', weekly_load=1))
+                used += 1
+
+            theory, left = [], max(0, target - used)
+            while left > 0:
+                load = min(left, rng.choice([3, 3, 4]))
+                name = f"{year_key} Theory {len(theory) + 1}"
+                theory.append(name)
+                subs.append(dict(name=name, code=name[-9:].replace(' ', '').upper(), type='Theory', weekly_load=load))
+                left -= load
+
+            loads = {s['name']: s['weekly_load'] for s in subs}
+            for div in divs:
+                batch_divs = [f"{div}-{div[-1]}{b + 1}" for b in range(batches)]
+                for name in theory:
+                    demands.append((dept, loads[name], [(name, div)], 1))
+                demands.append((dept, 2 * ELECTIVE_LOAD, [(n, div) for n in elective], 2))
+                for name in lab_names:
+                    demands.append((dept, 2 * batches, [(name, b) for b in batch_divs], 1))
+                    if name.startswith(f"{dept} Special Lab"):
+                        key = name.rsplit(' ', 1)[0]
+                        special_hours[key] = special_hours.get(key, 0) + 2 * batches
+                if tutorial:
+                    demands.append((dept, batches, [(tutorial, b) for b in batch_divs], 1))
+
+    # Faculty, split across departments in proportion to their load
+    total_hours = sum(d[1] for d in demands)
+    n_teachers = teachers or max(2, math.ceil(total_hours / TEACHER_HOURS))
+    dept_hours = {}
+    for dept, hours, _, _ in demands:
+        dept_hours[dept] = dept_hours.get(dept, 0) + hours
+    faculty, pool = [], {}
+    for i, (dept, hours) in enumerate(dept_hours.items()):
+        share = max(2, round(n_teachers * hours / total_hours))
+        if i == len(dept_hours) - 1: share = max(2, n_teachers - len(faculty))
+        pool[dept] = []
+        for _ in range(share):
+            tid = f"F{len(faculty) + 1:04d}"
+            pool[dept].append(tid)
+            faculty.append(dict(id=tid, name=f"{dept} Faculty {len(pool[dept])}", role='Faculty',
+                                experience=rng.randint(1, 25), shift=rng.choice(['A', 'B', 'C', 'C']), skills=[]))
+
+    # Biggest demands first, each to the least-loaded teachers of its department
+    load = {f['id']: 0 for f in faculty}
+    allocations = []
+    order = list(range(len(demands)))
+    rng.shuffle(order)
+    order.sort(key=lambda i: -demands[i][1])
+    for i in order:
+        dept, hours, targets, need = demands[i]
+        chosen = sorted(pool[dept], key=lambda t: (load[t], rng.random()))[:need]
+        for t in chosen: load[t] += hours / need
+        for j, (subject, division) in enumerate(targets):
+            allocations.append(dict(teacher_id=chosen[j % need], subject_name=subject, division=division))
+
+    # Rooms: a home room per division, labs sized to the rotation load
+    all_divs = [d for divs in divs_by_year.values() for d in divs]
+    n_theory = theory_rooms or math.ceil(len(all_divs) * 1.1)
+    theory_names = [f"T{i + 1:03d}" for i in range(n_theory)]
+    special_rooms = []
+    for key in special_keys:
+        count = max(1, math.ceil(special_hours.get(key, 0) / (week * ROOM_USE)))
+        special_rooms += [(f"S{len(special_rooms) + 1:03d}", key) for _ in range(count)]
+    lab_hours = sum(2 * batches * labs for _ in all_divs) - sum(special_hours.values())
+    n_lab = lab_rooms or max(batches, math.ceil(lab_hours / (week * ROOM_USE)))
+    lab_names = [f"L{i + 1:03d}" for i in range(n_lab)]
+
+    return dict(
+        config=dict(slots_per_day=SLOTS_PER_DAY, recess_index=RECESS_INDEX, days=list(DAYS)),
+        resources=dict(lab_rooms=lab_names + [r for r, _ in special_rooms], theory_rooms=theory_names),
+        subjects=subjects, lab_prefs={},
+        home_rooms={d: theory_names[i % n_theory] for i, d in enumerate(all_divs)},
+        faculty=faculty, allocations=allocations, divisions=divs_by_year,
+        rooms=[dict(name=r, type='Classroom') for r in theory_names]
+              + [dict(name=r, type='Lab') for r in lab_names]
+              + [dict(name=r, type='Lab', special_assignment=key) for r, key in special_rooms]
+    )
+
+def describe(request):
+    divs = [d for divs in request['divisions'].values() for d in divs]
+    hours = sum(s['weekly_load'] for subs in request['subjects'].values() for s in subs)
+    return (f"{len(request['divisions'])} years, {len(divs)} divisions, {len(request['faculty'])} teachers, "
+            f"{len(request['resources']['theory_rooms'])} theory + {len(request['resources']['lab_rooms'])} lab rooms, "
+            f"{len(request['allocations'])} allocations, {hours} subject-hours")
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic TimetableRequest")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--departments", type=int, default=1)
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--divisions", type=int, default=3, help="per year")
+    parser.add_argument("--batches", type=int, default=3, help="per division")
+    parser.add_argument("--labs", type=int, help="lab subjects per year (default: batches)")
+    parser.add_argument("--special-labs", type=int, default=1, help="per department")
+    parser.add_argument("--density", type=float, default=0.8, help="share of a division's week that is taught")
+    parser.add_argument("--teachers", type=int, help="institution-wide (default: sized to the load)")
+    parser.add_argument("--theory-rooms", type=int)
+    parser.add_argument("--lab-rooms", type=int)
+    parser.add_argument("-o", "--output", help="write here instead of stdout")
+    args = parser.parse_args()
+
+    request = synthetic_request(
+        seed=args.seed, departments=args.departments, years=args.years, divisions=args.divisions,
+        batches=args.batches, labs=args.labs, special_labs=args.special_labs, density=args.density,
+        teachers=args.teachers, theory_rooms=args.theory_rooms, lab_rooms=args.lab_rooms)
+    print(describe(request), file=sys.stderr)
+    if args.output:
+        with open(args.output, "w") as f: json.dump(request, f, indent=2)
+    else:
+        json.dump(request, sys.stdout, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,7 @@
 import random
+import time
 import webbrowser
 import os
-import copy
-from collections import defaultdict
 
 # ==========================================
 # 1. CONFIGURATION
@@ -153,71 +152,86 @@ class Gene:
         self.teacher = teacher 
         self.teachers_list = teachers_list 
         self.batch = batch 
-        self.day = -1
-        self.slot = -1
-        self.assigned_room = []
     def __repr__(self): return f"{self.div}|{self.subject}"
 
+_UNSET = object()
+
 class Schedule:
+    # Flat tables written through an undo trail so run_solver can reuse one
+    # Schedule for every run instead of deep-copying the genes.
     def __init__(self, genes):
         self.genes = genes
-        self.grid = defaultdict(lambda: defaultdict(lambda: defaultdict(set)))
-        self.div_slots = defaultdict(lambda: defaultdict(list))
-        self.teacher_slots = defaultdict(lambda: defaultdict(list))
-        self.theory_rooms_used = defaultdict(lambda: defaultdict(int))
-        self.div_batch_busy = defaultdict(lambda: defaultdict(lambda: defaultdict(set))) 
-        self.div_subject_history = defaultdict(lambda: defaultdict(lambda: defaultdict(lambda: None)))
-        self.div_type_history = defaultdict(lambda: defaultdict(lambda: defaultdict(lambda: None)))
+        self.placements = {}        # gene -> (day, slot, rooms)
+        self.busy = {}              # ('teacher'|'room', day, slot, id) -> True
+        self.div_slots = {}         # (div, day) -> slots
+        self.theory_rooms_used = {} # (day, slot) -> rooms in use
+        self.div_batch_busy = {}    # (day, slot, div) -> batches
+        self.div_subject_history = {}
+        self.div_type_history = {}
+        self.trail = []
+
+    def _write(self, table, key, value):
+        self.trail.append((table, key, table.get(key, _UNSET)))
+        table[key] = value
+
+    def checkpoint(self):
+        return len(self.trail)
+
+    def rollback(self, mark):
+        while len(self.trail) > mark:
+            table, key, old = self.trail.pop()
+            if old is _UNSET: del table[key]
+            else: table[key] = old
+
+    def reset(self):
+        self.rollback(0)
 
     def is_free(self, day, start, duration, div, teachers=None, rooms=None, batches=None):
         for s in range(start, start + duration):
             if s == CONSTANTS['RECESS_INDEX']: return False
             if s >= 9: return False
             
+            current_busy = self.div_batch_busy.get((day, s, div), ())
             if batches:
-                current_busy = self.div_batch_busy[day][s][div]
                 if "ALL" in current_busy: return False
                 for b in batches:
                     if b in current_busy: return False
             else:
-                if self.div_batch_busy[day][s][div]: return False
+                if current_busy: return False
 
             if teachers:
                 for t in teachers:
-                    if t and t.id != "-1" and t.id in self.grid[day][s]['teacher']: return False
+                    if t and t.id != "-1" and ('teacher', day, s, t.id) in self.busy: return False
             if rooms:
                 for r in rooms:
-                    if r != "Library" and r in self.grid[day][s]['room']: return False
+                    if r != "Library" and ('room', day, s, r) in self.busy: return False
         return True
 
     def book(self, gene, day, start, rooms, teachers):
-        gene.day = day
-        gene.slot = start
-        gene.assigned_room = rooms
+        write = self._write
+        write(self.placements, gene, (day, start, rooms))
         for i in range(gene.duration):
             idx = start + i
-            self.div_subject_history[day][idx][gene.div] = gene.subject
-            self.div_type_history[day][idx][gene.div] = gene.type
-            self.div_slots[gene.div][day].append(idx)
-
-            if gene.batch: 
-                self.div_batch_busy[day][idx][gene.div].add(gene.batch)
-            elif gene.type == "LAB": 
-                for b in gene.lab_subjects: 
-                    self.div_batch_busy[day][idx][gene.div].add(b)
-            else: 
-                self.div_batch_busy[day][idx][gene.div].add("ALL")
+            write(self.div_subject_history, (day, idx, gene.div), gene.subject)
+            write(self.div_type_history, (day, idx, gene.div), gene.type)
+            write(self.div_slots, (gene.div, day), self.div_slots.get((gene.div, day), ()) + (idx,))
+
+            if gene.batch: added = {gene.batch}
+            elif gene.type == "LAB": added = set(gene.lab_subjects)
+            else: added = {"ALL"}
+            key = (day, idx, gene.div)
+            write(self.div_batch_busy, key, self.div_batch_busy.get(key, frozenset()) | added)
 
             if teachers:
                 for t in teachers:
                     if t and t.id != "-1":
-                        self.grid[day][idx]['teacher'].add(t.id)
-                        self.teacher_slots[t.id][day].append(idx)
+                        write(self.busy, ('teacher', day, idx, t.id), True)
             for r in rooms:
-                if r != "Library": self.grid[day][idx]['room'].add(r)
+                if r != "Library": write(self.busy, ('room', day, idx, r), True)
             
-            if gene.type == "THEORY": self.theory_rooms_used[day][idx] += 1
-            elif gene.type == "ELECTIVE": self.theory_rooms_used[day][idx] += 2
+            used = self.theory_rooms_used.get((day, idx), 0)
+            if gene.type == "THEORY": write(self.theory_rooms_used, (day, idx), used + 1)
+            elif gene.type == "ELECTIVE": write(self.theory_rooms_used, (day, idx), used + 2)
 
 # ==========================================
 # 4. WORKLOAD GENERATION
@@ -311,7 +325,7 @@ def check_soft_constraints(schedule, div, day, slot, gene):
 
     # 3. PREVENT TRAPPING STUDENTS
     if gene.type in ["THEORY", "ELECTIVE"] and slot >= 7:
-        afternoon_activity = schedule.div_batch_busy[day][5][div]
+        afternoon_activity = schedule.div_batch_busy.get((day, 5, div))
         if afternoon_activity and "ALL" not in afternoon_activity:
              return 100000
 
@@ -319,16 +333,16 @@ def check_soft_constraints(schedule, div, day, slot, gene):
     if gene.type == "LAB" and slot == 5:
         has_late_lecture = False
         for check_s in [7, 8]:
-            if schedule.div_type_history[day][check_s][div] in ["THEORY", "ELECTIVE"]:
+            if schedule.div_type_history.get((day, check_s, div)) in ["THEORY", "ELECTIVE"]:
                 has_late_lecture = True
                 break
         if has_late_lecture:
             return 10000
 
     # 5. HOLE ELIMINATION
-    current_slots = schedule.div_slots[div][day]
+    current_slots = schedule.div_slots.get((div, day))
     if current_slots:
-        simulated_slots = current_slots + [slot for s in range(gene.duration)]
+        simulated_slots = list(current_slots) + [slot for s in range(gene.duration)]
         simulated_slots = sorted(list(set(simulated_slots)))
         start_t = min(simulated_slots)
         end_t = max(simulated_slots)
@@ -347,8 +361,8 @@ def check_soft_constraints(schedule, div, day, slot, gene):
         prev2 = prev1 - 1
         if prev2 == CONSTANTS['RECESS_INDEX']: prev2 -= 1
         if prev1 >= 0 and prev2 >= 0:
-            t1 = schedule.div_type_history[day][prev1][div]
-            t2 = schedule.div_type_history[day][prev2][div]
+            t1 = schedule.div_type_history.get((day, prev1, div))
+            t2 = schedule.div_type_history.get((day, prev2, div))
             if t1 in ["THEORY", "ELECTIVE"] and t2 in ["THEORY", "ELECTIVE"]:
                 cost += 500 
 
@@ -356,33 +370,37 @@ def check_soft_constraints(schedule, div, day, slot, gene):
     prev_s = slot - 1
     if prev_s == CONSTANTS['RECESS_INDEX']: prev_s -= 1
     if prev_s >= 0:
-         prev_subj = schedule.div_subject_history[day][prev_s][div]
+         prev_subj = schedule.div_subject_history.get((day, prev_s, div))
          if prev_subj and prev_subj == gene.subject: return 10000 
     next_s = slot + 1
     if next_s == CONSTANTS['RECESS_INDEX']: next_s += 1
     if next_s < 9:
-         next_subj = schedule.div_subject_history[day][next_s][div]
+         next_subj = schedule.div_subject_history.get((day, next_s, div))
          if next_subj and next_subj == gene.subject: return 10000 
 
     # 8. Gap Filling
     if gene.type == "MATHS_TUT":
-        busy_batches = schedule.div_batch_busy[day][slot][div]
+        busy_batches = schedule.div_batch_busy.get((day, slot, div))
         if busy_batches and "ALL" not in busy_batches:
              return -10000 
         if slot >= 6: return -200
 
     # 9. Lab Packing
     if gene.type == "LAB":
-        busy_batches = schedule.div_batch_busy[day][slot][div]
-        if busy_batches: cost -= 2000 
+        if schedule.div_batch_busy.get((day, slot, div)): cost -= 2000 
         
     return cost
 
-def run_solver(iterations=5000): 
+def run_solver(iterations=5000, time_budget=None, plateau=None, on_run=None): 
+    """Best of up to ``iterations`` restarts, cut short after ``time_budget``
+    seconds or ``plateau`` runs without improvement. ``on_run(run, score,
+    unplaced, gaps)`` is called after every run."""
     print("--- Starting Final Solver (Zero Gaps + Anti-Trap + Home Rooms) ---")
+    deadline = time.time() + time_budget if time_budget else None
+    last_gain = 0
     base_genes = distribute_workload()
     best_fitness = -float('inf')
-    best_sched = None
+    best_placements = None
     
     def priority_sort(g):
         if "BE" in g.div: return 0  
@@ -393,12 +411,14 @@ def run_solver(iterations=5000):
 
     base_genes.sort(key=priority_sort)
 
+    schedule = Schedule(base_genes)
     for run in range(iterations):
-        all_genes = copy.deepcopy(base_genes)
-        schedule = Schedule(all_genes)
+        if deadline is not None and time.time() >= deadline: break
+        if plateau is not None and run - last_gain >= plateau: break
+        schedule.reset()
         unplaced = []
         
-        for g in all_genes:
+        for g in base_genes:
             placed = False
             best_local_cost = float('inf')
             best_move = None
@@ -417,12 +437,12 @@ def run_solver(iterations=5000):
                     
                     rooms_to_book = []
                     if g.type == "THEORY":
-                        if schedule.theory_rooms_used[d][s] >= 5: continue
+                        if schedule.theory_rooms_used.get((d, s), 0) >= 5: continue
                         # UPDATED: Pass 'g.div' to prioritize Home Room
                         rooms = get_theory_rooms(schedule, d, s, g.div, 1)
                         if rooms: rooms_to_book = rooms
                     elif g.type == "ELECTIVE":
-                        if schedule.theory_rooms_used[d][s] >= 4: continue
+                        if schedule.theory_rooms_used.get((d, s), 0) >= 4: continue
                         # UPDATED: Pass 'g.div'
                         rooms = get_theory_rooms(schedule, d, s, g.div, 2)
                         if rooms: rooms_to_book = rooms
@@ -455,25 +475,30 @@ def run_solver(iterations=5000):
         score = 10000 - (len(unplaced) * 5000)
         
         total_gaps = 0
-        for div in schedule.div_slots:
-            for d in range(5):
-                slots = sorted(schedule.div_slots[div][d])
-                if len(slots) > 1:
-                    span = slots[-1] - slots[0] + 1
-                    gaps = span - len(slots)
-                    if slots[0] < 4 and slots[-1] > 4:
-                        gaps -= 1
-                    if gaps > 0: total_gaps += gaps
+        for slots in schedule.div_slots.values():
+            slots = sorted(slots)
+            if len(slots) > 1:
+                span = slots[-1] - slots[0] + 1
+                gaps = span - len(slots)
+                if slots[0] < 4 and slots[-1] > 4:
+                    gaps -= 1
+                if gaps > 0: total_gaps += gaps
         
         score -= (total_gaps * 500) 
+        if on_run: on_run(run, score, len(unplaced), total_gaps)
 
         if score > best_fitness:
             best_fitness = score
-            best_sched = schedule
+            last_gain = run
+            best_placements = [(g, schedule.placements[g]) for g in base_genes if g in schedule.placements]
             print(f"Run {run}: Score {score} (Unplaced: {len(unplaced)}, Gaps: {total_gaps})")
             if len(unplaced) == 0 and total_gaps == 0: break 
-            
-    return best_sched
+    
+    if best_placements is None: return None
+    schedule.reset()
+    for g, (d, s, rms) in best_placements:
+        schedule.book(g, d, s, rms, g.teachers_list if g.teachers_list else [g.teacher])
+    return schedule
 
 # ==========================================
 # 6. HTML GENERATION
@@ -521,8 +546,9 @@ def generate_html(schedule):
                 
                 active_genes = []
                 for g in schedule.genes:
-                    if g.day == day and g.div == div:
-                        if g.slot <= slot < g.slot + g.duration:
+                    placement = schedule.placements.get(g)
+                    if placement and placement[0] == day and g.div == div:
+                        if placement[1] <= slot < placement[1] + g.duration:
                             active_genes.append(g)
                 
                 if not active_genes:
@@ -539,22 +565,22 @@ def generate_html(schedule):
                 active_genes.sort(key=lambda x: 0 if x.type in ["LAB", "MATHS_TUT"] else 1)
                 
                 for g in active_genes:
-                    is_continuation = (slot > g.slot)
+                    g_slot, rs = schedule.placements[g][1:]
+                    is_continuation = (slot > g_slot)
                     cont_str = "<span class='cont'>(cont.)</span>" if is_continuation else ""
                     
                     if g.type == "THEORY":
-                        content += f"<div class='sub-name'>{g.subject}</div><div class='teach-name'>{g.teacher.name}</div><span class='room'>[{g.assigned_room[0]}]</span>"
+                        content += f"<div class='sub-name'>{g.subject}</div><div class='teach-name'>{g.teacher.name}</div><span class='room'>[{rs[0]}]</span>"
                     
                     elif g.type == "ELECTIVE":
                         subs = g.subject.split('/')
                         ts = g.teachers_list
-                        rs = g.assigned_room
                         content += f"<span class='elective-tag'>ELECTIVE</span><br><div class='sub-name'>{subs[0]}</div> <div class='teach-name'>({ts[0].name})</div> <span class='room'>[{rs[0]}]</span><hr style='width:50%; opacity:0.3; margin:4px 0;'><div class='sub-name'>{subs[1]}</div> <div class='teach-name'>({ts[1].name})</div> <span class='room'>[{rs[1]}]</span>"
                     
                     elif g.type in ["LAB", "MATHS_TUT"]:
                         style = "color:#d84315;" if g.type == "MATHS_TUT" else ""
                         t_name = g.teacher.name if g.teacher else "TBA"
-                        room = g.assigned_room[0] if g.assigned_room else "TBA"
+                        room = rs[0] if rs else "TBA"
                         batch_lbl = g.batch if g.batch else "ALL"
                         content += f"<div class='lab-item' style='{style}'><b>{batch_lbl}:</b> {g.subject} {cont_str}<br>{t_name} [{room}]</div>"
 
@@ -93,6 +93,7 @@ class Schedule:
         self.teacher_slots = defaultdict(lambda: defaultdict(list))
         self.classrooms_used = defaultdict(lambda: defaultdict(int))
         self.general_labs_used = defaultdict(lambda: defaultdict(int))
+        self.subject_days = set()  # (div, subject, day) already taught
 
     def is_free(self, day, start, duration, div, teachers=None, rooms=None):
         for s in range(start, start + duration):
@@ -113,6 +114,7 @@ class Schedule:
         gene.slot = start
         gene.assigned_room = rooms
         gene.assigned_teachers = teachers
+        self.subject_days.add((gene.div, gene.subject, day))
         for i in range(gene.duration):
             idx = start + i
             self.grid[day][idx]['div'].add(gene.div)
@@ -176,6 +178,9 @@ async def generate_timetable(req: TimetableRequest):
     teacher_map = {t.id: Teacher(t) for t in req.faculty}
     all_teachers = list(teacher_map.values())
     all_genes = []
+    allocation_index = {}
+    for a in req.allocations:
+        allocation_index.setdefault((a.subject_name, a.division), a.teacher_id)
     
     # Build Workload
     for year, divs in req.divisions.items():
@@ -185,7 +190,7 @@ async def generate_timetable(req: TimetableRequest):
             theory_subs = [s for s in year_subjects if s.type == 'Theory']
             for sub in theory_subs:
                 # Find allocated teacher
-                assigned_id = next((a.teacher_id for a in req.allocations if a.subject_name == sub.name and a.division == div), None)
+                assigned_id = allocation_index.get((sub.name, div))
                 teacher = teacher_map.get(assigned_id)
                 
                 # Update Load
@@ -226,7 +231,7 @@ async def generate_timetable(req: TimetableRequest):
     for g in theories:
         placed = False
         days = list(range(len(req.config['days']))); random.shuffle(days)
-        t = g.teacher
+        teachers = [g.teacher] if g.teacher else [] # unallocated subjects run as TBA
         
         home = req.home_rooms.get(g.div, req.resources['theory_rooms'][0])
         rooms_to_try = [home] + [r for r in req.resources['theory_rooms'] if r != home]
@@ -237,13 +242,13 @@ async def generate_timetable(req: TimetableRequest):
             
             for s in possible_slots:
                 # Check soft constraint: One slot per day per subject
-                if any(x.day == d and x.subject == g.subject for x in schedule.genes if x.div == g.div):
+                if (g.div, g.subject, d) in schedule.subject_days:
                     break # Try next day
                 
-                if schedule.is_free(d, s, 1, g.div, [t]):
+                if schedule.is_free(d, s, 1, g.div, teachers):
                     for r in rooms_to_try:
                         if schedule.is_free(d, s, 1, None, rooms=[r]):
-                            schedule.book(g, d, s, [r], [t])
+                            schedule.book(g, d, s, [r], teachers)
                             placed = True; break
                 if placed: break
             if placed: break
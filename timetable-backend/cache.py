@@ -0,0 +1,116 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger("TimetableSolver")
+
+# Bump when the solver changes what a given payload produces, or what an
+# entry holds, so entries left on disk by an older build are not served.
+CACHE_FORMAT = 3
+
+def request_key(req):
+    """Content hash of a TimetableRequest.
+
+    The payload is dumped with defaults filled in and keys sorted, so two
+    submissions of the same wizard state hash alike however they were
+    serialized. The seed is part of the payload; the worker count and the
+    stats flag are not, as neither changes what a seeded solve finds.
+    """
+    payload = req.model_dump(mode="json", exclude={"solver": {"workers", "stats"}})
+    blob = json.dumps({"v": CACHE_FORMAT, "request": payload}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+class ResultCache:
+    """LRU of finished results keyed by ``request_key``, bounded by size.
+
+    ``max_bytes`` caps the JSON size of what is held in memory (0 disables
+    the cache). With ``directory`` set, entries are also written there, so
+    every uvicorn worker pointed at the same directory can serve them.
+    """
+    def __init__(self, max_bytes=64 << 20, directory=None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.entries = OrderedDict()    # key -> (value, size)
+        self.bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        if directory: os.makedirs(directory, exist_ok=True)
+
+    def get(self, key):
+        if not self.max_bytes: return None
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+        blob = self._read(key)
+        with self.lock:
+            if blob is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            value = json.loads(blob)
+            self._insert(key, value, len(blob))
+            return value
+
+    def put(self, key, value):
+        if not self.max_bytes: return
+        blob = json.dumps(value, separators=(",", ":"))
+        with self.lock:
+            self._insert(key, value, len(blob))
+        self._write(key, blob)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries), "bytes": self.bytes, "max_bytes": self.max_bytes,
+                "hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+    def _insert(self, key, value, size):
+        old = self.entries.pop(key, None)
+        if old is not None: self.bytes -= old[1]
+        if size > self.max_bytes: return
+        self.entries[key] = (value, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (_, dropped) = self.entries.popitem(last=False)
+            self.bytes -= dropped
+            self.evictions += 1
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _read(self, key):
+        if not self.directory: return None
+        try:
+            with open(self._path(key)) as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+        except OSError:
+            logger.warning(f"Result cache: could not read {key}", exc_info=True)
+            return None
+
+    def _write(self, key, blob):
+        if not self.directory: return
+        # Write-then-rename so another worker never reads half a file
+        try:
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                f.write(blob)
+            os.replace(tmp, self._path(key))
+        except OSError:
+            logger.warning(f"Result cache: could not write {key}", exc_info=True)
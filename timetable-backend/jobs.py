@@ -0,0 +1,233 @@
+import math
+import threading
+import time
+import uuid
+import logging
+from collections import defaultdict, deque
+from concurrent.futures import Future
+
+logger = logging.getLogger("TimetableSolver")
+
+class Job:
+    def __init__(self, progress=None):
+        self.id = uuid.uuid4().hex
+        self.status = "queued"      # queued -> running -> done | failed | cancelled
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.error = None
+        self.error_status = None    # HTTP status the failure maps to
+        self.result = None
+        self.progress = progress    # anything with snapshot(), updated by the work itself
+        self.key = None             # content key identical submissions share
+        self.tenant = None
+        self.priority = False
+        self.waiters = 0            # submissions still interested in the result
+        self.handed_off = 0         # of those, ones the next event stream speaks for
+        self.cancelled = False
+        self.future = Future()
+
+    def summary(self):
+        return {
+            "job_id": self.id, "status": self.status, "error": self.error,
+            "created": self.created, "started": self.started, "finished": self.finished,
+            "progress": self.progress.snapshot() if self.progress is not None else {}
+        }
+
+class QueueFull(Exception):
+    """Raised by ``JobManager.submit`` when no more work can be queued;
+    ``retry_after`` is a guess, in whole seconds, at when there will be room."""
+    def __init__(self, retry_after):
+        super().__init__("Too many timetable requests queued")
+        self.retry_after = retry_after
+
+class JobManager:
+    """Runs generation work off the event loop and remembers the last ``keep`` jobs.
+
+    Submissions carrying a ``key`` are coalesced: while a job with that key
+    is queued or running, an identical submission gets the same job back
+    instead of starting another solve.
+
+    ``max_workers`` threads take jobs from queues holding at most
+    ``max_queue`` jobs per tenant and ``max_total`` in all; beyond that
+    ``submit`` raises QueueFull. Priority jobs (re-solves of a published
+    timetable) are bounded on their own and go before all others. Within
+    a class, the next job
+    comes from the tenant with the fewest jobs running, ties going to the
+    one served longest ago, so one department submitting a burst cannot
+    starve the rest.
+
+    Every submission, coalesced or not, counts as a waiter; once all of them
+    ``release`` the job it is cancelled. An event stream ``watch``-ing a job
+    is a waiter too, or stands in for a submission ``hand_off`` gave it. A cancelled job leaves the queue
+    at once, or, if running, has its progress asked to stop.
+    """
+    def __init__(self, max_workers=2, keep=100, max_queue=None, max_total=None):
+        self.max_workers = max_workers
+        self.max_queue = 4 * max_workers if max_queue is None else max_queue     # per tenant
+        self.max_total = 4 * self.max_queue if max_total is None else max_total
+        self.keep = keep
+        self.jobs = {}
+        self.inflight = {}          # key -> unfinished job
+        self.coalesced = 0
+        self.rejected = 0
+        self.queues = (defaultdict(deque), defaultdict(deque))     # (priority, normal): tenant -> [(job, fn)]
+        self.queued = 0
+        self.running = defaultdict(int)     # tenant -> jobs running
+        self.served = {}                    # tenant -> when it last had a job started
+        self.seconds_per_job = None         # moving average, for Retry-After
+        self.lock = threading.Lock()
+        self.ready = threading.Condition(self.lock)
+        for i in range(max_workers):
+            threading.Thread(target=self._work, name=f"solver_{i}", daemon=True).start()
+
+    def submit(self, fn, progress=None, key=None, tenant=None, priority=False):
+        with self.lock:
+            if key is not None and key in self.inflight:
+                self.coalesced += 1
+                job = self.inflight[key]
+                job.waiters += 1
+                return job
+            # Bounded per tenant, so one department's burst never turns the others away;
+            # priority jobs are bounded on their own, so fresh runs never block them
+            queues = self.queues[0 if priority else 1]
+            if len(queues.get(tenant, ())) >= self.max_queue or sum(map(len, queues.values())) >= self.max_total:
+                self.rejected += 1
+                raise QueueFull(self._retry_after())
+            job = Job(progress)
+            job.key, job.tenant, job.priority = key, tenant, priority
+            job.waiters = 1
+            self.jobs[job.id] = job
+            if key is not None: self.inflight[key] = job
+            self._evict()
+            self.queues[0 if priority else 1][tenant].append((job, fn))
+            self.queued += 1
+            self.ready.notify()
+        return job
+
+    def completed(self, result, progress=None):
+        """A job already done with ``result``, for work answered without a solve."""
+        job = Job(progress)
+        job.status, job.result = "done", result
+        job.started = job.finished = job.created
+        job.future.set_result(job)
+        with self.lock:
+            self.jobs[job.id] = job
+            self._evict()
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def hand_off(self, job):
+        """The submitter follows ``job`` by event stream, which carries its interest from now on."""
+        with self.lock:
+            job.handed_off += 1
+
+    def watch(self, job):
+        """An event stream follows ``job`` until it ends or calls ``release``."""
+        with self.lock:
+            if job.handed_off: job.handed_off -= 1
+            else: job.waiters += 1
+
+    def release(self, job):
+        """One waiter lost interest (its client went away); the last one out cancels."""
+        with self.lock:
+            job.waiters -= 1
+            if job.waiters > 0: return
+        self.cancel(job)
+
+    def cancel(self, job):
+        """Stops ``job`` without a result, or while other submissions still want
+        it only drops the caller's interest. False if it had already finished."""
+        with self.lock:
+            if job.finished is not None: return False
+            if job.waiters > 1:
+                job.waiters -= 1
+                return True
+            job.cancelled = True
+            # An identical submission from now on starts afresh rather than joining a dying job
+            if self.inflight.get(job.key) is job: del self.inflight[job.key]
+            queue = self.queues[0 if job.priority else 1].get(job.tenant)
+            entry = next((e for e in queue or () if e[0] is job), None)
+            if entry is None:
+                if job.progress is not None: job.progress.request_stop()
+                return True
+            queue.remove(entry)
+            if not queue: del self.queues[0 if job.priority else 1][job.tenant]
+            self.queued -= 1
+        self._finish(job)
+        return True
+
+    def stats(self):
+        with self.lock:
+            return {
+                "workers": self.max_workers, "running": sum(self.running.values()),
+                "queued": self.queued, "max_queue": self.max_queue, "max_total": self.max_total,
+                "rejected": self.rejected,
+                "queued_by_tenant": {str(t): len(q) for queues in self.queues for t, q in queues.items()}
+            }
+
+    def _retry_after(self):
+        per_job = self.seconds_per_job or 10.0
+        return max(1, math.ceil(per_job * (self.queued + 1) / self.max_workers))
+
+    def _next(self):
+        # Caller holds the lock and has checked that something is queued
+        for queues in self.queues:
+            if not queues: continue
+            tenant = min(queues, key=lambda t: (self.running[t], self.served.get(t, 0.0)))
+            job, fn = queues[tenant].popleft()
+            if not queues[tenant]: del queues[tenant]
+            self.queued -= 1
+            self.running[tenant] += 1
+            self.served[tenant] = time.time()
+            return job, fn
+
+    def _work(self):
+        while True:
+            with self.lock:
+                while not self.queued: self.ready.wait()
+                job, fn = self._next()
+            try:
+                self._run(job, fn)
+            finally:
+                with self.lock:
+                    self.running[job.tenant] -= 1
+                    if not self.running[job.tenant]: del self.running[job.tenant]
+                    took = job.finished - job.started
+                    if job.cancelled: pass      # says nothing about how long a solve takes
+                    elif self.seconds_per_job is None: self.seconds_per_job = took
+                    else: self.seconds_per_job = 0.8 * self.seconds_per_job + 0.2 * took
+
+    def _run(self, job, fn):
+        job.status = "running"
+        job.started = time.time()
+        try:
+            if not job.cancelled: job.result = fn(job)
+            job.status = "done"
+        except Exception as e:
+            job.error = getattr(e, "detail", None) or str(e)
+            job.error_status = getattr(e, "status_code", 500)
+            if job.cancelled: pass
+            elif job.error_status >= 500: logger.exception(f"Job {job.id} failed")
+            else: logger.info(f"Job {job.id} rejected: {job.error}")
+            job.status = "failed"
+        finally:
+            self._finish(job)
+
+    def _finish(self, job):
+        if job.cancelled:
+            job.status, job.result = "cancelled", None
+            logger.info(f"Job {job.id} cancelled")
+        job.finished = time.time()
+        with self.lock:
+            if self.inflight.get(job.key) is job: del self.inflight[job.key]
+        job.future.set_result(job)
+
+    def _evict(self):
+        # Oldest finished jobs go first; running ones are never dropped.
+        finished = [j for j in self.jobs.values() if j.finished is not None]
+        for job in sorted(finished, key=lambda j: j.finished)[:max(0, len(self.jobs) - self.keep)]:
+            del self.jobs[job.id]
@@ -1,17 +1,34 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Literal
 import random
-import copy
+import math
+import os
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 from collections import defaultdict
 import re
+import json
+import asyncio
 import logging
 
+import metrics
+from jobs import JobManager, QueueFull
+from cache import ResultCache, request_key
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("TimetableSolver")
 
 app = FastAPI()
+job_manager = JobManager(max_workers=int(os.environ.get("TIMETABLE_JOB_WORKERS", "2")),
+                         max_queue=int(os.environ.get("TIMETABLE_QUEUE_SIZE", "8")),
+                         max_total=int(os.environ.get("TIMETABLE_QUEUE_TOTAL", "32")))
+result_cache = ResultCache(max_bytes=int(os.environ.get("TIMETABLE_CACHE_BYTES", str(64 << 20))),
+                           directory=os.environ.get("TIMETABLE_CACHE_DIR") or None)
 
 app.add_middleware(
     CORSMiddleware,
@@ -21,6 +38,36 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+class RecordLatency:
+    # Plain ASGI rather than @app.middleware("http"): BaseHTTPMiddleware keeps
+    # http.disconnect from the endpoint, so waiters never saw a client leave.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http": return await self.app(scope, receive, send)
+        started, observed = time.perf_counter(), False
+
+        def observe(status):
+            nonlocal observed
+            observed = True
+            # Route templates, not raw paths, so job ids don't each get a series
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            metrics.REQUEST_SECONDS.observe(time.perf_counter() - started, scope["method"], path, status)
+
+        async def timed_send(message):
+            if message["type"] == "http.response.start": observe(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        except Exception:
+            if not observed: observe(500)
+            raise
+
+app.add_middleware(RecordLatency)
+
 # ==========================================
 # 1. INPUT MODELS
 # ==========================================
@@ -59,6 +106,20 @@ class RoomInput(BaseModel):
     type: str
     special_assignment: Optional[str] = None
 
+class SolverOptions(BaseModel):
+    workers: int = 1                # processes sharing the restarts
+    seed: Optional[int] = None
+    improve: Optional[Literal["anneal", "tabu"]] = None     # local search after the restarts
+    improve_seconds: float = 5.0
+    time_budget: Optional[float] = None     # wall-clock seconds for the whole solve
+    max_runs: Optional[int] = None          # restarts; RUN_BUDGET unless a time budget is set
+    target_score: Optional[int] = None      # stop once a timetable scores this much
+    plateau_runs: Optional[int] = None      # stop after this many runs without improvement
+    stats: bool = False             # /generate-timetable returns {"timetable", "stats"}
+    decompose: bool = False         # solve each year on its own, then reconcile shared teachers/rooms
+    alternatives: int = 1           # keep this many mutually different timetables (/generate-alternatives)
+    min_difference: float = 0.2     # share of sessions two alternatives must place differently
+
 class TimetableRequest(BaseModel):
     config: ConfigData
     resources: ResourceData
@@ -70,12 +131,47 @@ class TimetableRequest(BaseModel):
     allocations: List[AllocationData]
     divisions: Dict[str, List[str]]
     rooms: List[RoomInput]
+    solver: SolverOptions = SolverOptions()
+
+class Unavailability(BaseModel):
+    id: str                         # faculty id or room name
+    days: List[str] = []            # empty means every day
+    slots: List[int] = []           # empty means every slot
+
+class ChangeSet(BaseModel):
+    teachers: List[Unavailability] = []
+    rooms: List[Unavailability] = []
+
+class BatchEntry(BaseModel):
+    batch: str
+    subject: str
+    teacher: str
+    room: str
+
+class TimetableEntry(BaseModel):
+    # One session as format_entry writes it
+    slot: int
+    duration: int
+    type: str
+    subject: str
+    teacher: str
+    room: str
+    batches: Optional[List[BatchEntry]] = None
+
+class RepairRequest(BaseModel):
+    request: TimetableRequest       # may carry its own edits, e.g. a reassigned allocation
+    previous: Dict[str, Dict[str, List[TimetableEntry]]]    # an earlier /generate-timetable result
+    changes: ChangeSet = ChangeSet()
+    seconds: float = 2.0            # cap on the search, used only if greedy repair falls short
+    seed: Optional[int] = None
 
 # ==========================================
 # 2. CORE CLASSES
 # ==========================================
 
 class Teacher:
+    __slots__ = ('id', 'name', 'shift', 'current_load', 'max_load')
+
     def __init__(self, data: FacultyData):
         self.id = data.id
         self.name = data.name
@@ -94,6 +190,8 @@ class Teacher:
     def __repr__(self): return self.name
 
 class DummyTeacher:
+    __slots__ = ('id', 'name', 'current_load', 'max_load', 'shift')
+
     def __init__(self, id="-1", name="TBA"):
         self.id = id; self.name = name
         self.current_load = 0; self.max_load = 999; self.shift = "ALL"
@@ -101,110 +199,261 @@ class DummyTeacher:
     def assign_load(self, duration=1): pass
 
 class Gene:
-    def __init__(self, div, type, subject, duration=1, 
+    """Immutable demand record; where it lands lives in ``Schedule.placements``."""
+    __slots__ = ('gid', 'div', 'type', 'subject', 'duration', 'teachers_list', 'lab_subjects', 'batch_ids',
+                 'div_id', 'teacher_idx', 'batch_idx', 'whole_div', 'room_plan', 'starts', 'sole_rooms', 'slot_cost')
+
+    def __init__(self, gid, div, type, subject, duration=1, 
                  teachers_list=None, lab_subjects=None, batch_ids=None):
+        self.gid = gid
         self.div = div
         self.type = type 
         self.subject = subject 
         self.duration = duration
-        self.teachers_list = teachers_list if teachers_list else []
-        self.lab_subjects = lab_subjects if lab_subjects else [] 
-        self.batch_ids = batch_ids if batch_ids else [] 
-        self.day = -1
-        self.slot = -1
-        self.assigned_rooms = []
+        self.teachers_list = tuple(teachers_list) if teachers_list else ()
+        self.lab_subjects = tuple(lab_subjects) if lab_subjects else () 
+        self.batch_ids = tuple(batch_ids) if batch_ids else () 
+        # Interned ids, filled in by Problem when the request is compiled
+        self.div_id = -1
+        self.teacher_idx = ()       # real teachers only, TBA placeholders dropped
+        self.batch_idx = ()         # named batches; "ALL" is whole_div
+        self.whole_div = False
+        self.room_plan = ()         # per lab batch: (ROOM_*, candidate room ids)
+        self.starts = 0             # week bits it may start at, resources aside
+        self.sole_rooms = ()        # special rooms it can only have, one per such batch
+        self.slot_cost = ()         # [slot] -> the part of calculate_cost fixed by the slot alone
 
     def __repr__(self): return f"{self.div}|{self.type}|{self.subject}"
 
+class Occupancy:
+    """Week-wide occupancy: one bitmask per teacher, room, division and batch,
+    bit ``day * slots_per_day + slot``, so a conflict check is a few ANDs."""
+    def __init__(self, problem):
+        self.n_days = problem.constants['DAYS']
+        self.slots_per_day = problem.constants['SLOTS_PER_DAY']
+        self.teachers = [0] * len(problem.teachers)
+        self.rooms_at = list(problem.room_blocked_at)     # rooms taken out of service start busy
+        self.div_any = [0] * len(problem.divisions)  # any session of the division
+        self.div_all = [0] * len(problem.divisions)  # whole-division sessions (batch "ALL")
+        self.batches = [0] * len(problem.batches)
+        self.recess = problem.recess_mask
+
+    def span(self, day, start, duration):
+        return ((1 << duration) - 1) << (day * self.slots_per_day + start)
+
+    def bit(self, day, slot):
+        return day * self.slots_per_day + slot
+
+    def free_rooms(self, day, start, duration):
+        """Bitmask of room ids free for the whole span (none across recess)."""
+        if self.span(day, start, duration) & self.recess: return 0
+        busy = 0
+        base = day * self.slots_per_day + start
+        for bit in range(base, base + duration):
+            busy |= self.rooms_at[bit]
+        return ~busy
+
+_UNSET = object()
+
 class Schedule:
-    def __init__(self, genes, constants):
-        self.genes = genes
-        self.constants = constants
-        self.grid = defaultdict(lambda: defaultdict(lambda: defaultdict(set)))
-        self.div_slots = defaultdict(lambda: defaultdict(list))
-        self.teacher_slots = defaultdict(lambda: defaultdict(list))
-        self.div_batch_busy = defaultdict(lambda: defaultdict(lambda: defaultdict(set)))
-        self.theory_rooms_used = defaultdict(lambda: defaultdict(int))
+    """Bookings for one set of genes; every write goes through a value trail,
+    so ``rollback``/``reset`` cost only what was booked since."""
+    def __init__(self, problem):
+        self.problem = problem
+        self.genes = problem.genes
+        self.constants = problem.constants
+        self.occ = Occupancy(problem)
+        self.n_days = problem.constants['DAYS']
+        week = self.n_days * problem.constants['SLOTS_PER_DAY']
+        n_divs = len(problem.divisions)
+        self.placements = {}        # gid -> (day, slot, rooms)
+        # div_id * n_days + day -> (first slot, last slot, busy slots, sessions)
+        self.div_day = [None] * (n_divs * self.n_days)
+        self.totals = {'gaps': 0, 'sparse': 0}
+        self.theory_rooms_used = [0] * week
         
-        self.div_subjects = defaultdict(lambda: defaultdict(lambda: defaultdict(str)))
-        self.div_type_history = defaultdict(lambda: defaultdict(lambda: defaultdict(str)))
-        self.div_daily_count = defaultdict(lambda: defaultdict(int))
+        self.div_subjects = [[None] * week for _ in range(n_divs)]      # [div_id][bit] -> subject
+        self.div_type_history = [[None] * week for _ in range(n_divs)]  # [div_id][bit] -> gene type
+        self.div_cells = [[()] * week for _ in range(n_divs)]          # [div_id][bit] -> gids, booking order
+        self.trail = []
 
-    def is_free(self, day, start, gene, strict_repetition_check=True):
-        if start + gene.duration > self.constants['SLOTS_PER_DAY']: return False
-        
-        if strict_repetition_check:
-            prev_s = start - 1
-            if prev_s == self.constants['RECESS_INDEX']: prev_s -= 1
-            if prev_s >= 0:
-                prev_sub = self.div_subjects[day][prev_s][gene.div]
-                if prev_sub == gene.subject: return False 
-
-            next_s = start + gene.duration
-            if next_s == self.constants['RECESS_INDEX']: next_s += 1
-            if next_s < self.constants['SLOTS_PER_DAY']:
-                next_sub = self.div_subjects[day][next_s][gene.div]
-                if next_sub == gene.subject: return False
-
-        for s in range(start, start + gene.duration):
-            if s == self.constants['RECESS_INDEX']: return False
-            
-            for b in gene.batch_ids:
-                busy_batches = self.div_batch_busy[day][s][gene.div]
-                if "ALL" in busy_batches: return False
-                if b == "ALL":
-                    if len(busy_batches) > 0: return False 
-                elif b in busy_batches:
-                    return False
-
-            for t in gene.teachers_list:
-                if t.id != "-1":
-                    if t.id in self.grid[day][s]['teacher']: return False
-                    if not t.is_available(s, self.constants['SLOTS_PER_DAY']): return False
+    def _write(self, table, key, value):
+        self.trail.append((table, key, table.get(key, _UNSET)))
+        table[key] = value
+
+    def _delete(self, table, key):
+        self.trail.append((table, key, table[key]))
+        del table[key]
+
+    def _set(self, table, index, value):
+        self.trail.append((table, index, table[index]))
+        table[index] = value
+
+    def _mark(self, table, index, span):
+        self.trail.append((table, index, table[index]))
+        table[index] |= span
+
+    def checkpoint(self):
+        return len(self.trail)
+
+    def rollback(self, mark):
+        trail = self.trail
+        while len(trail) > mark:
+            table, key, old = trail.pop()
+            if old is _UNSET: del table[key]
+            else: table[key] = old
 
+    def reset(self):
+        self.rollback(0)
+
+    def commit(self):
+        """Forgets the undo history; later rollbacks stop at this state."""
+        self.trail.clear()
+
+    def is_free(self, day, start, gene, strict_repetition_check=True):
+        slots_per_day = self.constants['SLOTS_PER_DAY']
+        if start + gene.duration > slots_per_day: return False
+        occ = self.occ
+        base = day * slots_per_day
+        span = ((1 << gene.duration) - 1) << (base + start)
+        if span & occ.recess: return False
+
+        div = gene.div_id
+        if span & occ.div_all[div]: return False
+        if gene.whole_div and span & occ.div_any[div]: return False
+        batches = occ.batches
+        for b in gene.batch_idx:
+            if span & batches[b]: return False
+
+        teachers, blocked = occ.teachers, self.problem.teacher_blocked
+        for t in gene.teacher_idx:
+            if span & (teachers[t] | blocked[t]): return False
+
+        if strict_repetition_check and self.repeats(day, start, gene): return False
         return True
 
+    def repeats(self, day, start, gene):
+        """Whether the slot before or after would be the same subject again."""
+        slots_per_day, recess = self.constants['SLOTS_PER_DAY'], self.constants['RECESS_INDEX']
+        subjects = self.div_subjects[gene.div_id]
+        base = day * slots_per_day
+        prev_s = start - 1
+        if prev_s == recess: prev_s -= 1
+        if prev_s >= 0 and subjects[base + prev_s] == gene.subject: return True
+        next_s = start + gene.duration
+        if next_s == recess: next_s += 1
+        return next_s < slots_per_day and subjects[base + next_s] == gene.subject
+
     def book(self, gene, day, start, rooms):
-        gene.day = day
-        gene.slot = start
-        gene.assigned_rooms = rooms
+        write = self._write
+        write(self.placements, gene.gid, (day, start, tuple(rooms)))
         
-        self.div_daily_count[gene.div][day] += 1
+        occ = self.occ
+        div = gene.div_id
+        span = occ.span(day, start, gene.duration)
+        self._account_day(div, day, start, gene.duration, (span & ~occ.div_any[div]).bit_count())
+        self._mark(occ.div_any, div, span)
+        if gene.whole_div: self._mark(occ.div_all, div, span)
+        for b in gene.batch_idx: self._mark(occ.batches, b, span)
+        for t in gene.teacher_idx: self._mark(occ.teachers, t, span)
+        room_index = self.problem.room_index
+        room_bits = 0
+        for r in rooms:
+            r_id = room_index.get(r)
+            if r_id is not None: room_bits |= 1 << r_id
         
+        subjects, types, cells = self.div_subjects[div], self.div_type_history[div], self.div_cells[div]
         for i in range(gene.duration):
-            idx = start + i
-            self.div_subjects[day][idx][gene.div] = gene.subject 
-            self.div_type_history[day][idx][gene.div] = gene.type
-
-            for b in gene.batch_ids:
-                self.div_batch_busy[day][idx][gene.div].add(b)
-            for t in gene.teachers_list:
-                if t.id != "-1":
-                    self.grid[day][idx]['teacher'].add(t.id)
-                    self.teacher_slots[t.id][day].append(idx)
-            for r in rooms:
-                if r != "TBA": self.grid[day][idx]['room'].add(r)
-            self.div_slots[gene.div][day].append(idx)
+            bit = occ.bit(day, start + i)
+            if room_bits: self._mark(occ.rooms_at, bit, room_bits)
+            self._set(cells, bit, cells[bit] + (gene.gid,))
+            self._set(subjects, bit, gene.subject)
+            self._set(types, bit, gene.type)
             if gene.type in ["THEORY", "ELECTIVE"]:
-                self.theory_rooms_used[day][idx] += len(rooms)
+                self._set(self.theory_rooms_used, bit, self.theory_rooms_used[bit] + len(rooms))
+
+    def unbook(self, gene):
+        """Inverse of ``book``; undoable like any other write."""
+        day, start, rooms = self.placements[gene.gid]
+        self._delete(self.placements, gene.gid)
+
+        occ = self.occ
+        div = gene.div_id
+        span = occ.span(day, start, gene.duration)
+        # Teachers, batches, rooms and whole-division sessions never overlap,
+        # so their bits can simply be cleared. Batch sessions of one division
+        # do overlap, hence div_any and the per-slot subject/type follow
+        # whatever is still booked in the cell.
+        if gene.whole_div: self._set(occ.div_all, div, occ.div_all[div] & ~span)
+        for b in gene.batch_idx: self._set(occ.batches, b, occ.batches[b] & ~span)
+        for t in gene.teacher_idx: self._set(occ.teachers, t, occ.teachers[t] & ~span)
+        room_index = self.problem.room_index
+        room_bits = 0
+        for r in rooms:
+            r_id = room_index.get(r)
+            if r_id is not None: room_bits |= 1 << r_id
+
+        genes = self.genes
+        subjects, types, cells = self.div_subjects[div], self.div_type_history[div], self.div_cells[div]
+        emptied = 0
+        for i in range(gene.duration):
+            bit = occ.bit(day, start + i)
+            if room_bits: self._set(occ.rooms_at, bit, occ.rooms_at[bit] & ~room_bits)
+            rest = tuple(gid for gid in cells[bit] if gid != gene.gid)
+            self._set(cells, bit, rest)
+            top = genes[rest[-1]] if rest else None
+            self._set(subjects, bit, top.subject if top else None)
+            self._set(types, bit, top.type if top else None)
+            if not rest: emptied |= 1 << bit
+            if gene.type in ["THEORY", "ELECTIVE"]:
+                self._set(self.theory_rooms_used, bit, self.theory_rooms_used[bit] - len(rooms))
+        if emptied: self._set(occ.div_any, div, occ.div_any[div] & ~emptied)
+
+        key = div * self.n_days + day
+        old = self.div_day[key]
+        slots_per_day = self.constants['SLOTS_PER_DAY']
+        mask = occ.div_any[div] >> (day * slots_per_day) & ((1 << slots_per_day) - 1)
+        new = None
+        if mask:
+            new = ((mask & -mask).bit_length() - 1, mask.bit_length() - 1, mask.bit_count(), old[3] - 1)
+        self._store_day(key, old, new)
+
+    def day_gaps(self, lo, hi, busy):
+        """Free slots between the first and last session of a day, recess excluded."""
+        span = hi - lo + 1
+        if lo < self.constants['RECESS_INDEX'] < hi: span -= 1
+        return span - busy
+
+    def _account_day(self, div, day, start, duration, new_slots):
+        # Folds one booking into the division-day summary and the running
+        # totals, so neither a candidate's gap delta nor the final count has
+        # to look at the individual slots again.
+        key = div * self.n_days + day
+        old = self.div_day[key]
+        end = start + duration - 1
+        if old is None:
+            new = (start, end, new_slots, 1)
+        else:
+            lo, hi, busy, sessions = old
+            new = (min(lo, start), max(hi, end), busy + new_slots, sessions + 1)
+        self._store_day(key, old, new)
+
+    def _day_terms(self, stats):
+        if stats is None: return 0, 0
+        lo, hi, busy, sessions = stats
+        return max(0, self.day_gaps(lo, hi, busy)), 1 if sessions < 3 else 0
+
+    def _store_day(self, key, old, new):
+        old_gaps, old_sparse = self._day_terms(old)
+        new_gaps, new_sparse = self._day_terms(new)
+        self._set(self.div_day, key, new)
+        if new_gaps != old_gaps:
+            self._write(self.totals, 'gaps', self.totals['gaps'] + new_gaps - old_gaps)
+        if new_sparse != old_sparse:
+            self._write(self.totals, 'sparse', self.totals['sparse'] + new_sparse - old_sparse)
 
     def calculate_gaps_and_sparse(self):
-        gaps = 0
-        sparse_penalty = 0
-        for div, d_map in self.div_slots.items():
-            for d, slots in d_map.items():
-                slots.sort()
-                valid = [s for s in slots if s != self.constants['RECESS_INDEX']]
-                if len(valid) > 1:
-                    span = valid[-1] - valid[0] + 1
-                    if valid[0] < self.constants['RECESS_INDEX'] < valid[-1]: span -= 1
-                    diff = span - len(valid)
-                    if diff > 0: gaps += diff
-                
-                daily_count = self.div_daily_count[div][d]
-                if 0 < daily_count < 3: 
-                    sparse_penalty += 1
-        return gaps, sparse_penalty
+        return self.totals['gaps'], self.totals['sparse']
 
 # ==========================================
 # 3. HELPER FUNCTIONS
@@ -213,243 +462,1246 @@ class Schedule:
 def normalize_key(s):
     return re.sub(r'[^a-zA-Z0-9]', '', s).lower().replace('maths', 'math')
 
-def check_room_free(schedule, day, start, duration, room):
-    for s in range(start, start+duration):
-        if s == schedule.constants['RECESS_INDEX']: return False
-        if room in schedule.grid[day][s]['room']: return False
-    return True
+ROOM_SPECIAL, ROOM_POOL, ROOM_FALLBACK = 0, 1, 2
 
-def get_rooms_for_gene(schedule, day, start, gene, resources, home_rooms, special_rooms):
+def get_rooms_for_gene(schedule, day, start, gene, rng=random):
+    problem = schedule.problem
+    names = problem.rooms
     needed = len(gene.teachers_list)
+    free = schedule.occ.free_rooms(day, start, gene.duration)
+    if not free: return None
     found_rooms = []
     
     if gene.type in ["THEORY", "ELECTIVE"]:
-        if schedule.theory_rooms_used[day][start] + needed > len(resources.theory_rooms): return None
-        pool = list(resources.theory_rooms); random.shuffle(pool)
-        home = home_rooms.get(gene.div)
-        
-        if home and home in pool:
-             if check_room_free(schedule, day, start, gene.duration, home):
-                 pool.remove(home)
-                 pool.insert(0, home)
-
-        for i in range(needed):
-            assigned = None
-            for r in pool:
-                if r not in found_rooms and check_room_free(schedule, day, start, gene.duration, r):
-                    assigned = r; break
-            if assigned: found_rooms.append(assigned)
-            
-    else: 
-        reserved_rooms = {r for rooms in special_rooms.values() for r in rooms}
-        lab_pool = [r for r in resources.lab_rooms if r not in reserved_rooms]
-        random.shuffle(lab_pool)
-        theory_pool = list(resources.theory_rooms); random.shuffle(theory_pool)
-        
-        for i in range(needed):
-            sub_name = gene.lab_subjects[i]
-            assigned = None
-            
-            if sub_name == 'PROJECT' or sub_name == 'LIBRARY':
-                for r in theory_pool:
-                     if r not in found_rooms and check_room_free(schedule, day, start, gene.duration, r):
-                        assigned = r; break
-                if not assigned: assigned = "Location TBA"
-            else:
-                norm_sub = normalize_key(sub_name)
-                special_key = next((k for k in special_rooms if normalize_key(k) in norm_sub or norm_sub in normalize_key(k)), None)
-                
-                if special_key:
-                    candidates = special_rooms[special_key]
-                    for r in candidates:
-                        if r not in found_rooms and check_room_free(schedule, day, start, gene.duration, r):
-                            assigned = r; break
-                    if not assigned: return None 
-                else:
-                    pool_to_use = theory_pool if gene.type == "MATHS_TUT" else lab_pool
-                    for r in pool_to_use:
-                        if r not in found_rooms and check_room_free(schedule, day, start, gene.duration, r):
-                            assigned = r; break
-            
-            if assigned: found_rooms.append(assigned)
+        if schedule.theory_rooms_used[schedule.occ.bit(day, start)] + needed > len(problem.theory_pool): return None
+        home = problem.home_room[gene.div_id]
+        if needed and home >= 0 and free >> home & 1:
+            found_rooms.append(names[home])
+            free &= ~(1 << home)
+        pool = [r for r in problem.theory_pool if free >> r & 1]
+        if len(pool) < needed - len(found_rooms): return None
+        found_rooms.extend(names[r] for r in rng.sample(pool, needed - len(found_rooms)))
+        return found_rooms
+
+    # Rooms of the same pool go to batches in random order, as if each
+    # pool had been shuffled once and handed out front to back.
+    for kind, candidates in gene.room_plan:
+        if kind == ROOM_SPECIAL:
+            assigned = next((r for r in candidates if free >> r & 1), -1)
+        else:
+            pool = [r for r in candidates if free >> r & 1]
+            assigned = rng.choice(pool) if pool else -1
+        if assigned < 0:
+            if kind != ROOM_FALLBACK: return None
+            found_rooms.append("Location TBA")
+            continue
+        found_rooms.append(names[assigned])
+        free &= ~(1 << assigned)
 
     if len(found_rooms) == needed: return found_rooms
     return None
 
-def calculate_cost(schedule, day, slot, gene, constants):
-    cost = 0
-    # 1. GRAVITY
-    cost += slot * 100
-    
-    if "BE" in gene.div and slot >= 4: cost += 50000
-
-    for t in gene.teachers_list:
-        if t.id == "-1": continue
-        t_slots = schedule.teacher_slots[t.id][day]
+def slot_costs(gene, slots_per_day):
+    """The terms of calculate_cost that depend on nothing but the slot."""
+    costs = []
+    for slot in range(slots_per_day):
+        # 1. GRAVITY
+        cost = slot * 100
+        if "BE" in gene.div and slot >= 4: cost += 50000
+        if gene.type == "ELECTIVE":
+            if slot == 0: cost -= 50000 
+            elif slot > 1: cost += 50000 
+        if gene.type == "MATHS_TUT":
+            if slot >= slots_per_day - 2: cost -= 100000 
+            elif slot < 5: cost += 50000 
+        costs.append(cost)
+    return tuple(costs)
+
+def calculate_cost(schedule, day, slot, gene):
+    constants = schedule.constants
+    cost = gene.slot_cost[slot]
+
+    occ = schedule.occ
+    div = gene.div_id
+    base = day * constants['SLOTS_PER_DAY']
+    for t in gene.teacher_idx:
+        t_mask = occ.teachers[t]
+        if not t_mask: continue
         prev, next_s = slot - 1, slot + gene.duration
         if prev == constants['RECESS_INDEX']: prev -= 1
         if next_s == constants['RECESS_INDEX']: next_s += 1
         consecutive = 0
-        if prev in t_slots: consecutive += 1
-        if next_s in t_slots: consecutive += 1
+        if prev >= 0 and t_mask >> (base + prev) & 1: consecutive += 1
+        if next_s < constants['SLOTS_PER_DAY'] and t_mask >> (base + next_s) & 1: consecutive += 1
         if consecutive >= 1: cost += 1000
         if consecutive >= 2: cost += 5000
 
     # 4. NUCLEAR GAP CHECKER (Aggressive Update)
-    current_slots = schedule.div_slots[gene.div][day]
-    if current_slots:
-        all_s = sorted(current_slots + [slot])
-        
-        # Calculate Span (including the potential new slot)
-        span = all_s[-1] - all_s[0] + 1
-        # Adjust for Recess
-        if all_s[0] < constants['RECESS_INDEX'] < all_s[-1]: 
-            span -= 1 
-            
-        count = len(all_s)
-        actual_gaps = span - count
+    day_stats = schedule.div_day[div * schedule.n_days + day]
+    if day_stats:
+        # Day summary as it would be with this session booked
+        lo, hi, busy, _ = day_stats
+        end = slot + gene.duration - 1
+        lo, hi = min(lo, slot), max(hi, end)
+        cand = ((1 << gene.duration) - 1) << (base + slot)
+        busy += (cand & ~occ.div_any[div]).bit_count()
+        actual_gaps = schedule.day_gaps(lo, hi, busy)
         
         if actual_gaps > 0:
             # 50 Million points per gap slot. Gap = Enemy #1.
             cost += (actual_gaps * 50000000) 
             
             # The "Commuter Constraint": Spanning recess with a gap is instant death (200M)
-            if all_s[0] < constants['RECESS_INDEX'] and all_s[-1] > constants['RECESS_INDEX']:
+            if lo < constants['RECESS_INDEX'] < hi:
                 cost += 200000000 
         else:
             # Reward compactness to break ties
             cost -= 10000 
 
-    if gene.type == "ELECTIVE":
-        if slot == 0: cost -= 50000 
-        elif slot > 1: cost += 50000 
-
-    if gene.type == "MATHS_TUT":
-        if slot >= constants['SLOTS_PER_DAY'] - 2: cost -= 100000 
-        elif slot < 5: cost += 50000 
-
     if gene.type == "THEORY":
         prev1 = slot - 1
         if prev1 == constants['RECESS_INDEX']: prev1 -= 1
         prev2 = prev1 - 1
         if prev2 == constants['RECESS_INDEX']: prev2 -= 1
         if prev1 >= 0 and prev2 >= 0:
-            t1 = schedule.div_type_history[day][prev1][gene.div]
-            t2 = schedule.div_type_history[day][prev2][gene.div]
+            types = schedule.div_type_history[div]
+            t1 = types[base + prev1]
+            t2 = types[base + prev2]
             if t1 == "THEORY" and t2 == "THEORY":
                 cost += 5000 
 
     if gene.type == "LAB":
-        busy_batches = schedule.div_batch_busy[day][slot][gene.div]
-        if busy_batches: cost -= 5000 
+        if occ.div_any[div] >> (base + slot) & 1: cost -= 5000 
 
     prev_s = slot - 1
     if prev_s == constants['RECESS_INDEX']: prev_s -= 1
     if prev_s >= 0:
-        prev_sub = schedule.div_subjects[day][prev_s][gene.div]
+        prev_sub = schedule.div_subjects[div][base + prev_s]
         if prev_sub == gene.subject: cost += 100000
 
     return cost
 
-def solve(genes, config, resources, home_rooms, special_rooms):
-    logger.info("--- Starting Solver (Zero Gap Aggression) ---")
-    best_sched = None
-    best_score = -float('inf')
-    
-    CONSTANTS = {
-        'SLOTS_PER_DAY': config.slots_per_day,
-        'RECESS_INDEX': 4 
-    }
-
-    random.shuffle(genes) 
-    genes.sort(key=lambda g: 0 if g.type == "LAB" else (1 if g.type == "MATHS_TUT" else (2 if g.type == "ELECTIVE" else 3)))
-
-    TOTAL_BATCHES = 3 
-
-    for run in range(1100): 
-        schedule = Schedule(copy.deepcopy(genes), CONSTANTS)
-        unplaced = []
+RUN_BUDGET = 1100
+CHUNK_RUNS = 50
+# Share of the budget after which construct() stops refusing back-to-back
+# repeats of a subject, and after which it takes the first fit (panic); None
+# never. Both stay off: evaluate() does not score repeats, so relaxed runs
+# would win on timetables the product has never allowed.
+RELAX_REPETITION_AFTER = None
+PANIC_AFTER = None
+TOTAL_BATCHES = 3 
+HOD_BLOCKS = [0, 2, 5, 7]
+PERFECT_SCORE = 1000000
+
+if metrics.PROFILE:
+    # Hot-path profiling replaces the functions themselves, so with it off
+    # the placement loop runs exactly the code above.
+    Schedule.is_free = metrics.timed("is_free", Schedule.is_free)
+    get_rooms_for_gene = metrics.timed("get_rooms_for_gene", get_rooms_for_gene)
+    calculate_cost = metrics.timed("calculate_cost", calculate_cost)
+
+def placement_order(genes, rng):
+    order = list(genes)
+    rng.shuffle(order) 
+    order.sort(key=lambda g: 0 if g.type == "LAB" else (1 if g.type == "MATHS_TUT" else (2 if g.type == "ELECTIVE" else 3)))
+    return order
+
+def _dilate(span, duration):
+    # Start bits whose ``duration``-long span overlaps ``span``
+    blocked = span
+    for i in range(1, duration): blocked |= span >> i
+    return blocked
+
+def start_domains(schedule):
+    """Per gid, the start bits still open under the hard per-resource rules;
+    empty means the gene cannot be placed, non-empty only that it might."""
+    problem, occ = schedule.problem, schedule.occ
+    room_busy = {}
+    for g in problem.genes:
+        for r in g.sole_rooms:
+            if r not in room_busy:
+                room_busy[r] = sum(1 << bit for bit, rooms in enumerate(occ.rooms_at) if rooms >> r & 1)
+    domains = []
+    for g in problem.genes:
+        busy = occ.div_all[g.div_id]
+        if g.whole_div: busy |= occ.div_any[g.div_id]
+        for b in g.batch_idx: busy |= occ.batches[b]
+        for t in g.teacher_idx: busy |= occ.teachers[t] | problem.teacher_blocked[t]
+        for r in g.sole_rooms: busy |= room_busy[r]
+        domains.append(g.starts & ~_dilate(busy, g.duration))
+    return domains
+
+def construct(schedule, order, rng, panic_mode=False, strict_rep=True, stop=None):
+    """One randomized greedy pass, fewest open starts first; returns the genes left unplaced
+    (meaningless once ``stop`` is set)."""
+    config = schedule.problem.config
+    unplaced = []
+    genes, neighbours = schedule.genes, schedule.problem.neighbours
+    slots_per_day = config.slots_per_day
+    day_mask = (1 << slots_per_day) - 1
+    domains = start_domains(schedule)
+    sizes = [d.bit_count() for d in domains]
+    pending = [g.gid for g in order]
+
+    while pending:
+        if stop is not None and stop.is_set(): break
+        gid = min(pending, key=sizes.__getitem__)
+        pending.remove(gid)
+        g = genes[gid]
+        domain = domains[gid]
+        if not domain:
+            unplaced.append(g)
+            continue
+        best_move = None
+        min_cost = float('inf')
+        
+        days = list(range(len(config.days))); rng.shuffle(days)
+        all_slots = list(range(config.slots_per_day))
         
-        panic_mode = run > 1500
-        strict_rep = run < 2500
+        valid_starts = []
+        
+        if g.duration == 2:
+            valid_hod = [s for s in HOD_BLOCKS if s + 2 <= config.slots_per_day]
 
-        for g in genes:
-            best_move = None
-            min_cost = float('inf')
-            
-            days = list(range(len(config.days))); random.shuffle(days)
-            all_slots = list(range(config.slots_per_day))
-            
-            valid_starts = []
-            
-            if g.duration == 2:
-                hod_blocks = [0, 2, 5, 7] 
-                valid_hod = [s for s in hod_blocks if s + 2 <= config.slots_per_day]
-
-                if len(g.batch_ids) < TOTAL_BATCHES:
-                    valid_starts = sorted(valid_hod, key=lambda x: -x) 
-                else:
-                    random.shuffle(valid_hod)
-                    valid_starts = valid_hod
-
-            elif g.type == "MATHS_TUT":
-                late = [7, 8, 6]; random.shuffle(late)
-                others = [s for s in all_slots if s not in late and s != 3 and s != 4]
-                random.shuffle(others)
-                valid_starts = late + others
-            elif g.type == "ELECTIVE":
-                early = [0, 1]
-                others = [s for s in all_slots if s not in early and s != 3 and s != 4]
-                random.shuffle(others)
-                valid_starts = early + others
+            if len(g.batch_ids) < TOTAL_BATCHES:
+                valid_starts = sorted(valid_hod, key=lambda x: -x) 
             else:
-                gap_filler = [3]
-                others = [s for s in all_slots if s != 3 and s != 4]
-                random.shuffle(others)
-                valid_starts = gap_filler + others
-
-            for d in days:
-                for s in valid_starts:
-                    if schedule.is_free(d, s, g, strict_repetition_check=strict_rep):
-                        rooms = get_rooms_for_gene(schedule, d, s, g, resources, home_rooms, special_rooms)
-                        if rooms:
-                            cost = calculate_cost(schedule, d, s, g, CONSTANTS)
-                            if cost < min_cost:
-                                min_cost = cost
-                                best_move = (d, s, rooms)
-                                if panic_mode: break 
-                                if cost <= -100000: break 
-                if best_move and (panic_mode or min_cost <= -100000): break
-            
-            if best_move:
-                schedule.book(g, best_move[0], best_move[1], best_move[2])
-            else:
-                unplaced.append(g)
-        
-        score = 1000000
-        score -= (len(unplaced) * 100000000) 
+                rng.shuffle(valid_hod)
+                valid_starts = valid_hod
+
+        elif g.type == "MATHS_TUT":
+            late = [7, 8, 6]; rng.shuffle(late)
+            others = [s for s in all_slots if s not in late and s != 3 and s != 4]
+            rng.shuffle(others)
+            valid_starts = late + others
+        elif g.type == "ELECTIVE":
+            early = [0, 1]
+            others = [s for s in all_slots if s not in early and s != 3 and s != 4]
+            rng.shuffle(others)
+            valid_starts = early + others
+        else:
+            gap_filler = [3]
+            others = [s for s in all_slots if s != 3 and s != 4]
+            rng.shuffle(others)
+            valid_starts = gap_filler + others
+
+        # The domain answers is_free's resource checks for every start at
+        # once, so only the repetition rule is left to test per start. Rooms
+        # are only picked for a start that would become the best so far.
+        # Preferred starts (the late tutorial slots, say) may lie past the end
+        # of a short day, so only this day's bits are looked at.
+        for d in days:
+            open_starts = domain >> (d * slots_per_day) & day_mask
+            for s in valid_starts:
+                if not open_starts >> s & 1: continue
+                if strict_rep and schedule.repeats(d, s, g): continue
+                cost = calculate_cost(schedule, d, s, g)
+                if cost >= min_cost: continue
+                rooms = get_rooms_for_gene(schedule, d, s, g, rng)
+                if not rooms: continue
+                min_cost = cost
+                best_move = (d, s, rooms)
+                if panic_mode: break 
+                if cost <= -100000: break 
+            if best_move and (panic_mode or min_cost <= -100000): break
         
-        gaps, sparse_days = schedule.calculate_gaps_and_sparse()
-        score -= (gaps * 50000000) # Increased to match cost logic
-        score -= (sparse_days * 300000) 
+        if best_move:
+            d, s, rooms = best_move
+            schedule.book(g, d, s, rooms)
+            span = ((1 << g.duration) - 1) << (d * slots_per_day + s)
+            ruled_out = {}
+            for h in neighbours[gid]:
+                duration = genes[h].duration
+                if duration not in ruled_out: ruled_out[duration] = ~_dilate(span, duration)
+                left = domains[h] & ruled_out[duration]
+                if left != domains[h]:
+                    domains[h] = left
+                    sizes[h] = left.bit_count()
+        else:
+            unplaced.append(g)
+    return unplaced
+
+def evaluate(schedule, unplaced):
+    score = PERFECT_SCORE
+    score -= (len(unplaced) * 100000000) 
+    
+    gaps, sparse_days = schedule.calculate_gaps_and_sparse()
+    score -= (gaps * 50000000) # Increased to match cost logic
+    score -= (sparse_days * 300000) 
+    return score, gaps, sparse_days
+
+class RunResult:
+    """Best run of a batch of restarts, small enough to ship between processes."""
+    __slots__ = ('run', 'score', 'unplaced', 'gaps', 'sparse_days', 'placements', 'runs', 'first_placed')
+
+    def __init__(self, run, score, unplaced, gaps, sparse_days, placements):
+        self.run = run
+        self.score = score
+        self.unplaced = unplaced        # gids
+        self.gaps = gaps
+        self.sparse_days = sparse_days
+        self.placements = placements    # gid -> (day, slot, rooms)
+        self.runs = 0                   # runs the batch executed
+        self.first_placed = None        # when a run of the batch first left nothing unplaced (epoch seconds)
+
+    @property
+    def good_enough(self):
+        return len(self.unplaced) == 0 and self.gaps <= 3 and self.sparse_days == 0
+
+MAX_ALTERNATIVES = 20
+
+class ElitePool:
+    """The ``k`` best runs that pairwise place at least ``min_difference`` of the ``n_genes``
+    sessions differently; a close run replaces its neighbours only by scoring better."""
+    def __init__(self, k, min_difference, n_genes):
+        self.k = k
+        self.min_difference = min_difference
+        self.n_genes = max(1, n_genes)
+        self.members = []           # best first
+
+    def admits(self, score):
+        # Cheap pre-check, before a run's placements are copied
+        return len(self.members) < self.k or score > self.members[-1].score
+
+    def difference(self, a, b):
+        pa, pb = a.placements, b.placements
+        differing = sum(1 for gid, at in pa.items() if gid not in pb or pb[gid][:2] != at[:2])
+        differing += sum(1 for gid in pb if gid not in pa)
+        return differing / self.n_genes
+
+    def offer(self, result):
+        if not self.admits(result.score): return False
+        # The same timetable is always near, or a run offered twice would list twice
+        near = [m for m in self.members if (d := self.difference(m, result)) < self.min_difference or d == 0]
+        if any(better(m, result) is m for m in near): return False
+        self.members = [m for m in self.members if m not in near] + [result]
+        self.members.sort(key=lambda m: (-m.score, m.run))
+        del self.members[self.k:]
+        return True
+
+class Budget:
+    """When the restarts stop: ``max_runs``, the deadline, ``target`` or ``plateau`` runs
+    without improvement, whichever comes first. Plain attributes, so it pickles."""
+    def __init__(self, max_runs=None, seconds=None, target=None, plateau=None):
+        self.started = time.time()
+        self.seconds = seconds
+        self.deadline = self.started + seconds if seconds else None
+        self.max_runs = max_runs if max_runs is not None or seconds else RUN_BUDGET
+        self.target = target
+        self.plateau = plateau
+
+    def expired(self):
+        return self.deadline is not None and time.time() >= self.deadline
+
+    def reached(self, result):
+        if result is None: return False
+        if self.target is not None: return result.score >= self.target
+        return result.good_enough
+
+    def spent(self, run):
+        frac = run / self.max_runs if self.max_runs else 0.0
+        if self.deadline is not None:
+            frac = max(frac, (time.time() - self.started) / self.seconds)
+        return frac
+
+    def cap(self, deadline):
+        """Moves the deadline (epoch seconds) earlier, never later."""
+        if self.deadline is None or deadline < self.deadline:
+            self.deadline = deadline
+            self.seconds = max(1e-3, deadline - self.started)
+
+    def share(self, fraction, max_runs):
+        """``fraction`` of the time left and ``max_runs`` runs, ending at good_enough: what a part
+        of the problem gets (target scores are for whole timetables)."""
+        share = Budget(None, None, None, self.plateau)
+        share.max_runs = max_runs
+        if self.deadline is not None:
+            share.cap(share.started + fraction * max(0.0, self.deadline - share.started))
+        return share
+
+    def chunks(self, rng):
+        """(first_run, n_runs, seed) per chunk of restarts; seeds come off ``rng`` in chunk
+        order, so a seeded solve runs the same whatever the workers."""
+        first = 0
+        while self.max_runs is None or first < self.max_runs:
+            n_runs = CHUNK_RUNS if self.max_runs is None else min(CHUNK_RUNS, self.max_runs - first)
+            yield first, n_runs, rng.getrandbits(64)
+            first += n_runs
+
+class EitherEvent:
+    """Set as soon as any of ``events`` is; enough of an Event for the solver loops."""
+    def __init__(self, *events):
+        self.events = events
+
+    def is_set(self):
+        return any(e.is_set() for e in self.events)
+
+def better(a, b):
+    if a is None: return b
+    if b is None: return a
+    if b.score > a.score or (b.score == a.score and b.run < a.run): return b
+    return a
+
+def run_restarts(schedule, order, first_run, n_runs, seed, budget, stop=None, on_run=None, elite=None):
+    """Runs restarts ``first_run .. first_run + n_runs - 1`` with a private RNG until the budget
+    or ``stop`` ends them, calling ``on_run(best, improved)`` and offering each run to ``elite``."""
+    rng = random.Random(seed)
+    best = None
+    runs = 0
+    first_placed = None
+    for run in range(first_run, first_run + n_runs):
+        if (stop is not None and stop.is_set()) or budget.expired(): break
+        runs += 1
+        schedule.reset()
+        spent = budget.spent(run)
+        strict_rep = RELAX_REPETITION_AFTER is None or spent < RELAX_REPETITION_AFTER
+        panic_mode = PANIC_AFTER is not None and spent > PANIC_AFTER
+        unplaced = construct(schedule, order, rng, panic_mode=panic_mode, strict_rep=strict_rep, stop=stop)
+        if stop is not None and stop.is_set():
+            runs -= 1   # cut short, so not a run
+            break
+        if unplaced: unplaced = repair_unplaced(schedule, unplaced, rng, strict_rep)
+        score, gaps, sparse_days = evaluate(schedule, unplaced)
+        if not unplaced and first_placed is None: first_placed = time.time()
         
         if run % 500 == 0: 
             logger.info(f"Run {run}: Score={score} Unplaced={len(unplaced)} Gaps={gaps} Sparse={sparse_days}")
         
-        if score > best_score:
-            best_score = score
-            best_sched = schedule
-            if len(unplaced) == 0 and gaps <= 3 and sparse_days == 0: 
-                break
-            
-    return best_sched
+        improved = best is None or score > best.score
+        if improved:
+            best = RunResult(run, score, [g.gid for g in unplaced], gaps, sparse_days, dict(schedule.placements))
+            if elite is not None: elite.offer(best)
+        elif elite is not None and elite.admits(score):
+            elite.offer(RunResult(run, score, [g.gid for g in unplaced], gaps, sparse_days, dict(schedule.placements)))
+        best.first_placed = first_placed
+        if on_run: on_run(best, improved)
+        if improved and budget.reached(best): break
+    if best is not None: best.runs = runs
+    return best
+
+# Solves start their pools from JobManager threads; a forked child could
+# inherit a lock another thread held (logging, metrics), so never fork.
+MP_START = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+_worker = {}
+
+def _init_worker(problem, order_ids, budget, stop, alternatives=None):
+    _worker['schedule'] = Schedule(problem)
+    _worker['order'] = [problem.genes[gid] for gid in order_ids]
+    _worker['budget'] = budget
+    _worker['stop'] = stop
+    _worker['alternatives'] = alternatives     # (k, min_difference) or None
+
+def _run_chunk(first_run, n_runs, seed):
+    budget = _worker['budget']
+    elite = None
+    if _worker['alternatives']:
+        elite = ElitePool(*_worker['alternatives'], len(_worker['schedule'].genes))
+    result = run_restarts(_worker['schedule'], _worker['order'], first_run, n_runs, seed, budget, _worker['stop'],
+                          elite=elite)
+    if budget.reached(result): _worker['stop'].set()
+    return result, elite.members if elite else [], metrics.take_hot()
+
+# Decomposition: every year is solved on its own (in parallel with
+# workers > 1), then the years are merged largest first. A year whose best
+# timetable clashes with those already merged over a shared teacher or
+# room is solved again around them; the others are taken as they are.
+# The re-solve books the merged years first, so their sessions hold the
+# contended slots, but its ejection chains may still move one of them
+# elsewhere to seat a session of the year being solved. Runs and time are
+# shared out over the solves still to come, so the last year and its
+# re-solve get their turn; a year that still cannot be re-solved keeps
+# what fits of its own timetable instead of failing the whole solve.
+
+def solve_part(problem, gids, budget, seed, reserved=None, stop=None, on_run=None):
+    """Restarts over the genes ``gids`` alone, around the ``reserved`` placements; returns
+    the best RunResult (reserved sessions included) and the runs executed."""
+    genes = problem.genes
+    schedule = Schedule(problem)
+    for gid, (d, s, rooms) in (reserved or {}).items():
+        schedule.book(genes[gid], d, s, rooms)
+    schedule.commit()
+    rng = random.Random(seed)
+    order = placement_order([genes[gid] for gid in gids], rng)
+    best, runs = None, 0
+    halt = threading.Event()
+    top, since = None, 0
+
+    def counted(result, improved):
+        nonlocal top, since
+        if on_run: on_run(result, improved)
+        since += 1
+        if top is None or result.score > top: top, since = result.score, 0
+        elif budget.plateau is not None and since >= budget.plateau: halt.set()
+
+    halted = halt if stop is None else EitherEvent(halt, stop)
+    for first, n_runs, chunk_seed in budget.chunks(rng):
+        result = run_restarts(schedule, order, first, n_runs, chunk_seed, budget, halted, counted)
+        if result is None: break
+        runs += result.runs
+        best = better(best, result)
+        if budget.reached(best) or budget.expired() or halted.is_set(): break
+    return best, runs
+
+def _init_part_worker(problem, stop):
+    _worker['problem'] = problem
+    _worker['stop'] = stop
+
+def _run_part(gids, budget, seed):
+    result = solve_part(_worker['problem'], gids, budget, seed, stop=_worker['stop'])
+    return result, metrics.take_hot()
+
+def merge_part(schedule, result, gids):
+    """Books a part's placements if none clashes with what ``schedule``
+    holds already; otherwise leaves it untouched and returns False."""
+    mark = schedule.checkpoint()
+    for gid in gids:
+        if gid not in result.placements: continue
+        gene = schedule.genes[gid]
+        d, s, rooms = result.placements[gid]
+        if not (schedule.is_free(d, s, gene, strict_repetition_check=False) and rooms_fit(schedule, d, s, gene, rooms)):
+            schedule.rollback(mark)
+            return False
+        schedule.book(gene, d, s, rooms)
+    return True
+
+def seat_part(schedule, result, gids, rng):
+    """Fallback for a year that could not be re-solved: books those of its
+    placements that still fit and pushes the rest in with ejection chains."""
+    genes = schedule.genes
+    left = []
+    for gid in gids:
+        gene, placement = genes[gid], result.placements.get(gid) if result is not None else None
+        if placement is not None:
+            d, s, rooms = placement
+            if schedule.is_free(d, s, gene, strict_repetition_check=False) and rooms_fit(schedule, d, s, gene, rooms):
+                schedule.book(gene, d, s, rooms)
+                continue
+        left.append(gene)
+    repair_unplaced(schedule, [g for g in left if not _relocate(schedule, g, rng)], rng, strict_rep=False)
+
+def solve_by_parts(problem, budget, rng, workers, stop, on_runs):
+    """Best merged RunResult over the years of ``problem``.
+    ``on_runs(n)`` is told about restarts as they finish."""
+    parts = problem.parts()
+    n = len(parts)
+    runs_done = 0
+
+    def counted(k):
+        nonlocal runs_done
+        runs_done += k
+        on_runs(k)
+
+    def share(solves, slices, spans=1):
+        # The runs left split evenly over the ``solves`` still to come (each
+        # year, then a re-solve for each year merged after the first), and
+        # ``spans`` of ``slices`` even slices of the time left
+        runs = None if budget.max_runs is None else max(1, (budget.max_runs - runs_done) // solves)
+        return budget.share(spans / slices, runs)
+
+    count_run = lambda result, improved: counted(1)
+    seeds = [rng.getrandbits(64) for _ in parts]
+    results = [None] * n
+    if workers > 1:
+        ctx = multiprocessing.get_context(MP_START)
+        shared_stop = ctx.Event()
+        pool_size = min(workers, n)
+        waves = -(-n // pool_size)
+        part_budget = share(2 * n - 1, waves + n - 1, waves)
+        with ProcessPoolExecutor(max_workers=pool_size, mp_context=ctx,
+                                 initializer=_init_part_worker, initargs=(problem, shared_stop)) as pool:
+            futures = [pool.submit(_run_part, gids, part_budget, seed) for gids, seed in zip(parts, seeds)]
+            pending = set(futures)
+            while pending:
+                _, pending = wait(pending, timeout=0.2)
+                if stop.is_set(): shared_stop.set()
+            for i, future in enumerate(futures):
+                (results[i], runs), hot = future.result()
+                metrics.add_hot(hot)
+                counted(runs)
+    else:
+        for i, (gids, seed) in enumerate(zip(parts, seeds)):
+            solves = 2 * n - 1 - i
+            results[i], _ = solve_part(problem, gids, share(solves, solves), seed, stop=stop, on_run=count_run)
+
+    schedule = Schedule(problem)
+    last_run = 0
+    for i, gids in enumerate(parts):
+        result = results[i]
+        if result is not None and merge_part(schedule, result, gids):
+            last_run = max(last_run, result.run)
+            continue
+        # Shared teachers or rooms clash: re-solve this year around the merged ones
+        resolved = None
+        if result is not None and not stop.is_set():
+            reserved = dict(schedule.placements)
+            resolved, _ = solve_part(problem, gids, share(n - i, n - i), rng.getrandbits(64), reserved, stop, count_run)
+        if resolved is None:
+            seat_part(schedule, result, gids, rng)
+            continue
+        schedule = Schedule(problem)
+        for gid, (d, s, rooms) in resolved.placements.items():
+            schedule.book(problem.genes[gid], d, s, rooms)
+        last_run = max(last_run, resolved.run)
+
+    placed = schedule.placements
+    unplaced = [gid for gids in parts for gid in gids if gid not in placed]
+    score, gaps, sparse_days = evaluate(schedule, unplaced)
+    return RunResult(last_run, score, unplaced, gaps, sparse_days, dict(placed))
+
+# Local search: temperatures are in score points, so early on a sparse
+# day (300k) is traded freely, a gap (50M) now and then, and by the end
+# only improvements are taken.
+ANNEAL_T0, ANNEAL_T1 = 2.5e7, 1e4
+TABU_SAMPLE = 8
+# Moving an anchored session costs more than a sparse day, less than a gap
+ANCHOR_PENALTY = 1000000
+TABU_TENURE = (10, 20)
+
+def allowed_starts(gene, slots_per_day):
+    if gene.duration == 2: return [s for s in HOD_BLOCKS if s + 2 <= slots_per_day]
+    if gene.type == "THEORY": return list(range(slots_per_day))
+    return [s for s in range(slots_per_day) if s != 3]
+
+def free_positions(schedule, gene, rng, exclude=None):
+    """Every (day, start, rooms) where ``gene`` fits right now."""
+    out = []
+    for d in range(schedule.n_days):
+        for s in allowed_starts(gene, schedule.constants['SLOTS_PER_DAY']):
+            if (d, s) == exclude or not schedule.is_free(d, s, gene): continue
+            rooms = get_rooms_for_gene(schedule, d, s, gene, rng)
+            if rooms: out.append((d, s, rooms))
+    return out
+
+def _relocate(schedule, gene, rng, exclude=None, greedy=True):
+    positions = free_positions(schedule, gene, rng, exclude)
+    if not positions: return False
+    if greedy:
+        d, s, rooms = min(positions, key=lambda p: calculate_cost(schedule, p[0], p[1], gene))
+    else:
+        d, s, rooms = rng.choice(positions)
+    schedule.book(gene, d, s, rooms)
+    return True
+
+def _move(schedule, unplaced, gene, rng):
+    d, s, _ = schedule.placements[gene.gid]
+    schedule.unbook(gene)
+    if not _relocate(schedule, gene, rng, exclude=(d, s), greedy=rng.random() < 0.5): return None
+    return {gene.gid}
+
+def _swap(schedule, unplaced, gene, rng, movable=None):
+    placements, genes = schedule.placements, schedule.genes
+    partners = [gid for gid in placements if gid != gene.gid and genes[gid].div_id == gene.div_id
+                and (movable is None or gid in movable)
+                and genes[gid].duration == gene.duration and placements[gid][:2] != placements[gene.gid][:2]]
+    if not partners: return None
+    other = genes[rng.choice(partners)]
+    (d1, s1, _), (d2, s2, _) = placements[gene.gid], placements[other.gid]
+    schedule.unbook(gene); schedule.unbook(other)
+    for g, d, s in ((gene, d2, s2), (other, d1, s1)):
+        if not schedule.is_free(d, s, g): return None
+        rooms = get_rooms_for_gene(schedule, d, s, g, rng)
+        if not rooms: return None
+        schedule.book(g, d, s, rooms)
+    return {gene.gid, other.gid}
+
+def _kick(schedule, unplaced, gene, rng, movable=None):
+    # Clears a random slot for an unplaced gene by ejecting whatever shares
+    # its division, batches or teachers there, then re-seats the ejected.
+    slots_per_day = schedule.constants['SLOTS_PER_DAY']
+    d, s = rng.randrange(schedule.n_days), rng.choice(allowed_starts(gene, slots_per_day))
+    genes = schedule.genes
+    teachers, batches = set(gene.teacher_idx), set(gene.batch_idx)
+    kicked = []
+    for gid, (pd, ps, _) in schedule.placements.items():
+        other = genes[gid]
+        if pd != d or ps >= s + gene.duration or s >= ps + other.duration: continue
+        same_div = other.div_id == gene.div_id and (gene.whole_div or other.whole_div or batches.intersection(other.batch_idx))
+        if same_div or teachers.intersection(other.teacher_idx):
+            if movable is not None and gid not in movable: return None
+            kicked.append(other)
+    for other in kicked: schedule.unbook(other)
+    if not schedule.is_free(d, s, gene): return None
+    rooms = get_rooms_for_gene(schedule, d, s, gene, rng)
+    if not rooms: return None
+    schedule.book(gene, d, s, rooms)
+    schedule._delete(unplaced, gene.gid)
+    for other in kicked:
+        if not _relocate(schedule, other, rng): schedule._write(unplaced, other.gid, True)
+    return {gene.gid} | {other.gid for other in kicked}
+
+# Ejection chains: an unplaced gene may eject up to EJECT_MAX sessions to
+# take a slot (sharing its teachers, division or batches, or holding the
+# rooms it needs), each of those may do the same down to EJECT_DEPTH
+# levels, and each level tries at most EJECT_TRIES of the cheapest slots.
+EJECT_MAX = 3
+EJECT_DEPTH = 2
+EJECT_TRIES = 6
+
+def _blockers(schedule, gene, at, d, s):
+    # Booked sessions that keep ``gene`` out of (d, s), and those merely
+    # holding rooms it could use there
+    base = d * schedule.constants['SLOTS_PER_DAY'] + s
+    problem, genes = schedule.problem, schedule.genes
+    teachers, batches, rooms = set(gene.teacher_idx), set(gene.batch_idx), set(gene.sole_rooms)
+    if gene.room_plan: wanted = {r for _, candidates in gene.room_plan for r in candidates}
+    else: wanted = set(problem.theory_pool)
+    found, holders = [], []
+    for bit in range(base, base + gene.duration):
+        for gid in at[bit]:
+            other = genes[gid]
+            if other in found or other in holders: continue
+            same_div = other.div_id == gene.div_id and (gene.whole_div or other.whole_div or batches.intersection(other.batch_idx))
+            if same_div or teachers.intersection(other.teacher_idx) or rooms.intersection(other.sole_rooms):
+                found.append(other)
+            elif any(problem.room_index.get(r) in wanted for r in schedule.placements[gid][2]):
+                holders.append(other)
+    return found, holders
+
+def eject_into(schedule, gene, rng, depth=EJECT_DEPTH, frozen=(), strict_rep=True):
+    """Seats the unplaced ``gene`` by re-seating the sessions in its way, up to ``depth`` deep;
+    on failure the schedule is as it was."""
+    slots_per_day = schedule.constants['SLOTS_PER_DAY']
+    at = [[] for _ in range(schedule.n_days * slots_per_day)]
+    for gid, (d, s, _) in schedule.placements.items():
+        base = d * slots_per_day + s
+        for bit in range(base, base + schedule.genes[gid].duration): at[bit].append(gid)
+    blocked = 0
+    for t in gene.teacher_idx: blocked |= schedule.problem.teacher_blocked[t]
+    frozen = set(frozen) | {gene.gid}
+
+    options = []
+    starts = gene.starts & ~_dilate(blocked, gene.duration)
+    while starts:
+        low = starts & -starts
+        bit = low.bit_length() - 1
+        starts ^= low
+        d, s = divmod(bit, slots_per_day)
+        found, holders = _blockers(schedule, gene, at, d, s)
+        if len(found) <= EJECT_MAX and not any(o.gid in frozen for o in found):
+            holders = [o for o in holders if o.gid not in frozen]
+            rng.shuffle(holders)
+            # Two-hour sessions are the hardest to re-seat, so eject them last
+            options.append((sum(o.duration for o in found), rng.random(), d, s, found, holders))
+    options.sort(key=lambda o: o[:2])
+
+    for _, _, d, s, found, holders in options[:EJECT_TRIES]:
+        mark = schedule.checkpoint()
+        for other in found: schedule.unbook(other)
+        rooms = schedule.is_free(d, s, gene, strict_rep) and get_rooms_for_gene(schedule, d, s, gene, rng)
+        # Short of rooms: eject room holders one at a time
+        while rooms is None and holders and len(found) < EJECT_MAX:
+            found = found + [holders.pop()]
+            schedule.unbook(found[-1])
+            rooms = get_rooms_for_gene(schedule, d, s, gene, rng)
+        if rooms:
+            schedule.book(gene, d, s, rooms)
+            chain = frozen | {o.gid for o in found}
+            if all(_relocate(schedule, o, rng)
+                   or (depth > 1 and eject_into(schedule, o, rng, depth - 1, chain, strict_rep)) for o in found):
+                return True
+        schedule.rollback(mark)
+    return False
+
+def repair_unplaced(schedule, unplaced, rng, strict_rep=True):
+    """What is left of ``unplaced`` after an ejection chain for each gene."""
+    return [g for g in unplaced if not eject_into(schedule, g, rng, strict_rep=strict_rep)]
+
+def _neighbour(schedule, unplaced, rng, movable=None):
+    """Applies one random move; returns the gids it touched, or None if it failed.
+    With ``movable`` only those sessions, and unplaced ones, are moved."""
+    genes = schedule.genes
+    if unplaced and rng.random() < 0.4:
+        gene = genes[rng.choice(list(unplaced))]
+        if _relocate(schedule, gene, rng):
+            schedule._delete(unplaced, gene.gid)
+            return {gene.gid}
+        return _kick(schedule, unplaced, gene, rng, movable)
+    placed = list(schedule.placements) if movable is None else [gid for gid in schedule.placements if gid in movable]
+    if not placed: return None
+    # Half the time aim at a division-day that is costing points
+    n_days = schedule.n_days
+    bad = [key for key, stats in enumerate(schedule.div_day) if stats and any(schedule._day_terms(stats))]
+    gene = None
+    if bad and rng.random() < 0.5:
+        key = rng.choice(bad)
+        cells = schedule.div_cells[key // n_days]
+        base = (key % n_days) * schedule.constants['SLOTS_PER_DAY']
+        gids = {gid for bit in range(base, base + schedule.constants['SLOTS_PER_DAY']) for gid in cells[bit]
+                if movable is None or gid in movable}
+        if gids: gene = genes[rng.choice(sorted(gids))]
+    if gene is None: gene = genes[rng.choice(placed)]
+    if rng.random() < 0.3: return _swap(schedule, unplaced, gene, rng, movable)
+    return _move(schedule, unplaced, gene, rng)
+
+def _apply_plan(schedule, unplaced, plan):
+    genes = schedule.genes
+    for gid in plan:
+        if gid in schedule.placements: schedule.unbook(genes[gid])
+    for gid, placement in plan.items():
+        if placement is None:
+            if gid not in unplaced: schedule._write(unplaced, gid, True)
+        else:
+            schedule.book(genes[gid], *placement)
+            if gid in unplaced: schedule._delete(unplaced, gid)
+
+def local_search(problem, start, seconds, method="anneal", seed=None, stop=None, on_improve=None, target=None,
+                 movable=None, anchor=None, temperatures=(ANNEAL_T0, ANNEAL_T1), anchor_penalty=ANCHOR_PENALTY):
+    """Anneals or tabu-searches from the ``start`` RunResult for ``seconds``, charging ``anchor_penalty``
+    per session away from its ``anchor`` slot; returns the best RunResult and the moves tried."""
+    rng = random.Random(seed)
+    genes = problem.genes
+    schedule = Schedule(problem)
+    for gid, (d, s, rooms) in start.placements.items():
+        schedule.book(genes[gid], d, s, rooms)
+    schedule.commit()
+    unplaced = dict.fromkeys(start.unplaced, True)
+    def energy():
+        e = -evaluate(schedule, unplaced)[0]
+        if anchor:
+            placements = schedule.placements
+            e += anchor_penalty * sum(1 for gid, pos in anchor.items() if gid in placements and placements[gid][:2] != pos)
+        return e
+
+    current = best_energy = energy()
+    best, tried, iteration = start, 0, 0
+    tabu = {}                   # (gid, day, slot) -> iteration it may return
+    began = time.monotonic()
+    deadline = began + seconds
+    goal = PERFECT_SCORE if target is None else min(target, PERFECT_SCORE)
+    while -best_energy < goal:
+        now = time.monotonic()
+        if now >= deadline or (stop is not None and stop.is_set()): break
+        iteration += 1
+        if method == "tabu":
+            options = []
+            for _ in range(TABU_SAMPLE):
+                mark = schedule.checkpoint()
+                touched = _neighbour(schedule, unplaced, rng, movable)
+                if touched is not None:
+                    options.append((energy(), {gid: schedule.placements.get(gid) for gid in touched}))
+                schedule.rollback(mark)
+            tried += TABU_SAMPLE
+            allowed = [(e, plan) for e, plan in options if e < best_energy or not any(
+                p is not None and tabu.get((gid, p[0], p[1]), 0) > iteration for gid, p in plan.items())]
+            if not allowed: continue
+            new, plan = min(allowed, key=lambda o: o[0])
+            for gid in plan:
+                if gid in schedule.placements:
+                    d, s, _ = schedule.placements[gid]
+                    tabu[(gid, d, s)] = iteration + rng.randint(*TABU_TENURE)
+            _apply_plan(schedule, unplaced, plan)
+        else:
+            mark = schedule.checkpoint()
+            touched = _neighbour(schedule, unplaced, rng, movable)
+            tried += 1
+            if touched is None:
+                schedule.rollback(mark)
+                continue
+            new = energy()
+            t0, t1 = temperatures
+            temp = t0 * (t1 / t0) ** ((now - began) / seconds)
+            if new > current and rng.random() >= math.exp((current - new) / temp):
+                schedule.rollback(mark)
+                continue
+        schedule.commit()
+        current = new
+        if current < best_energy:
+            best_energy = current
+            score, gaps, sparse_days = evaluate(schedule, unplaced)
+            best = RunResult(start.run, score, list(unplaced), gaps, sparse_days, dict(schedule.placements))
+            if on_improve: on_improve(best)
+    return best, tried
+
+class SolveProgress:
+    """Live view of one solve, shared with request handlers; ``version`` bumps on
+    every improvement and ``request_stop`` makes the solver return its best-so-far."""
+    def __init__(self):
+        self.started = time.time()
+        self.runs = 0
+        self.moves = 0              # local-search moves tried
+        self.best = None
+        self.version = 0
+        self.stop = threading.Event()
+        self.render = None          # placements -> timetable, set once genes exist
+        self.replayed = None        # final snapshot of an earlier identical solve
+        self.phase = "restarts"     # then "local_search"
+        self.solve_started = None
+        self.restarts_ended = None
+        self.first_feasible = None  # seconds into the solve
+        self.trajectory = []        # one entry per improvement
+        self.stats = None           # set by run_generation once the solve is over
+        self.elite = None           # ElitePool of SolverOptions.alternatives runs
+        self.alternatives = None    # their rendered timetables, set by run_generation
+        self.deadline = None        # epoch seconds the caller stops waiting at, from X-Deadline
+
+    def runs_done(self, n):
+        self.runs += n
+
+    def moves_done(self, n):
+        self.moves += n
+
+    def fully_placed(self, at):
+        """A run left nothing unplaced at ``at`` (epoch seconds), best or not."""
+        elapsed = at - (self.solve_started or self.started)
+        if self.first_feasible is None or elapsed < self.first_feasible: self.first_feasible = elapsed
+
+    def improved(self, result):
+        self.best = result
+        self.version += 1
+        elapsed = time.time() - (self.solve_started or self.started)
+        if not result.unplaced: self.fully_placed(time.time())
+        self.trajectory.append({
+            "run": result.run, "phase": self.phase, "elapsed": round(elapsed, 3), "score": result.score,
+            "unplaced": len(result.unplaced), "gaps": result.gaps, "sparse_days": result.sparse_days
+        })
+
+    def request_stop(self):
+        self.stop.set()
+
+    def replay(self, snap):
+        """Reports a cached solve's final numbers in place of a live one."""
+        self.replayed = snap
+        self.version += 1
+
+    def snapshot(self):
+        if self.replayed is not None:
+            return dict(self.replayed, version=self.version, cached=True)
+        elapsed = time.time() - self.started
+        snap = {
+            "runs": self.runs, "elapsed": round(elapsed, 3),
+            "runs_per_sec": round(self.runs / elapsed, 2) if elapsed > 0 else 0.0,
+            "version": self.version
+        }
+        if self.moves: snap["moves"] = self.moves
+        if self.best is not None:
+            snap.update({
+                "run": self.best.run, "score": self.best.score, "unplaced": len(self.best.unplaced),
+                "gaps": self.best.gaps, "sparse_days": self.best.sparse_days
+            })
+        return snap
+
+    def best_timetable(self):
+        if self.best is None or self.render is None: return None
+        return self.render(self.best.placements)
+
+    def statistics(self, genes):
+        """How the solve converged: the improvement trace, throughput, and
+        what the final timetable left unplaced, by gene type."""
+        started = self.solve_started or self.started
+        restart_seconds = (self.restarts_ended or time.time()) - started
+        unplaced = dict.fromkeys(["LAB", "MATHS_TUT", "ELECTIVE", "THEORY"], 0)
+        for gid in self.best.unplaced if self.best is not None else ():
+            unplaced[genes[gid].type] = unplaced.get(genes[gid].type, 0) + 1
+        return {
+            "runs": self.runs, "moves": self.moves,
+            "runs_per_sec": round(self.runs / restart_seconds, 2) if restart_seconds > 0 else 0.0,
+            "elapsed": round(time.time() - started, 3),
+            "best_run": self.best.run if self.best is not None else None,
+            "first_fully_placed": None if self.first_feasible is None else round(self.first_feasible, 3),
+            "unplaced_by_type": unplaced,
+            "trajectory": self.trajectory
+        }
+
+def solve(problem, options=None, progress=None):
+    """Best timetable found for ``problem`` under ``options``; anytime, so whatever
+    ends the search the best schedule seen so far is returned."""
+    logger.info("--- Starting Solver (Zero Gap Aggression) ---")
+    if options is None: options = SolverOptions()
+    genes = problem.genes
+    rng = random.Random(options.seed)
+    order = placement_order(genes, rng)
+    chunk_rng = random.Random(rng.getrandbits(64))
+    improve_seed = rng.getrandbits(64)
+
+    # With a time budget the local search keeps up to half of it
+    seconds = options.time_budget
+    if seconds and options.improve:
+        seconds -= min(options.improve_seconds, seconds / 2)
+    budget = Budget(options.max_runs, seconds, options.target_score, options.plateau_runs)
+    if progress is not None and progress.deadline is not None: budget.cap(progress.deadline)
+    chunks = budget.chunks(chunk_rng)
+    n_chunks = -(-budget.max_runs // CHUNK_RUNS) if budget.max_runs else options.workers
+    workers = max(1, min(options.workers, os.cpu_count() or 1, n_chunks))
+    if progress is None: progress = SolveProgress()
+    progress.solve_started = time.time()
+    # Kept for k = 1 too, so /generate-alternatives and a cache hit agree
+    elite = progress.elite = ElitePool(options.alternatives, options.min_difference, len(genes))
+    best = None
+    last_gain = 0
+
+    def report(result):
+        nonlocal best, last_gain
+        elite.offer(result)
+        if better(best, result) is not best:
+            best = result
+            last_gain = progress.runs
+            progress.improved(best)
+
+    def finished():
+        if progress.stop.is_set() or budget.expired() or budget.reached(best): return True
+        return budget.plateau is not None and progress.runs - last_gain >= budget.plateau
+
+    if options.decompose and len(problem.parts()) > 1:
+        def on_runs(n):
+            progress.runs_done(n)
+            metrics.RESTARTS.inc(n)
+        workers = max(1, min(options.workers, os.cpu_count() or 1))
+        report(solve_by_parts(problem, budget, rng, workers, progress.stop, on_runs))
+    elif workers == 1:
+        schedule = Schedule(problem)
+        halt = threading.Event()
+
+        def on_run(result, improved):
+            progress.runs_done(1)
+            metrics.RESTARTS.inc()
+            if result.first_placed is not None: progress.fully_placed(result.first_placed)
+            if improved: report(result)
+            if finished(): halt.set()
+
+        for first, n_runs, chunk_seed in chunks:
+            run_restarts(schedule, order, first, n_runs, chunk_seed, budget, EitherEvent(halt, progress.stop), on_run, elite)
+            if halt.is_set() or finished(): break
+    else:
+        ctx = multiprocessing.get_context(MP_START)
+        stop = ctx.Event()
+        shared = (elite.k, elite.min_difference)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker,
+                                 initargs=(problem, [g.gid for g in order], budget, stop, shared)) as pool:
+            # Keep every worker fed; chunks are only created as they are needed.
+            pending = set()
+            while True:
+                while not stop.is_set() and len(pending) < 2 * workers:
+                    chunk = next(chunks, None)
+                    if chunk is None: break
+                    pending.add(pool.submit(_run_chunk, *chunk))
+                if not pending: break
+                done, pending = wait(pending, timeout=0.05, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.cancelled(): continue
+                    result, members, hot = future.result()
+                    metrics.add_hot(hot)
+                    for member in members: elite.offer(member)
+                    if result is None: continue
+                    if result.first_placed is not None: progress.fully_placed(result.first_placed)
+                    progress.runs_done(result.runs)
+                    metrics.RESTARTS.inc(result.runs)
+                    report(result)
+                if not stop.is_set() and finished():
+                    # Drain the chunks already running; they see the event between runs.
+                    stop.set()
+                    for future in pending: future.cancel()
+
+    if best is None:
+        # Cut off before a single run (X-Deadline: 0, say): one pass still makes a timetable
+        result = run_restarts(Schedule(problem), order, 0, 1, chunk_rng.getrandbits(64), Budget(1))
+        progress.runs_done(1)
+        metrics.RESTARTS.inc()
+        report(result)
+    progress.restarts_ended = time.time()
+    if best is not None and options.improve and not progress.stop.is_set():
+        progress.phase = "local_search"
+        seconds = options.improve_seconds
+        if options.time_budget:
+            seconds = max(0.0, budget.started + options.time_budget - time.time())
+        if progress.deadline is not None: seconds = max(0.0, min(seconds, progress.deadline - time.time()))
+        _, moves = local_search(problem, best, seconds, options.improve, improve_seed,
+                                progress.stop, report, options.target_score)
+        progress.moves_done(moves)
+        metrics.MOVES.inc(moves)
+    
+    schedule = Schedule(problem)
+    for gid, (d, s, rooms) in best.placements.items():
+        schedule.book(genes[gid], d, s, rooms)
+    return schedule
 
 # ==========================================
-# 4. API ENDPOINT
+# 4. PROBLEM COMPILATION
 # ==========================================
 
-@app.post("/generate-timetable")
-async def generate_timetable(req: TimetableRequest):
+class Problem:
+    """A TimetableRequest compiled into genes plus dense integer ids; only
+    ``block_teacher``/``block_room`` change it, and only before solving."""
+    def __init__(self, req, teachers, subjects, special_rooms, genes):
+        self.config = req.config
+        self.resources = req.resources
+        self.home_rooms = req.home_rooms
+        self.special_rooms = special_rooms
+        self.constants = {
+            'SLOTS_PER_DAY': req.config.slots_per_day,
+            'RECESS_INDEX': 4,
+            'DAYS': len(req.config.days)
+        }
+        self.genes = genes
+
+        self.teachers = teachers
+        self.teacher_index = {t.id: i for i, t in enumerate(teachers)}
+        self.subjects = subjects
+        self.subject_index = {}
+        for i, s in enumerate(subjects):
+            self.subject_index.setdefault(s.name, i)
+        self.rooms = list(dict.fromkeys(
+            req.resources.lab_rooms + req.resources.theory_rooms
+            + [r.name for r in req.rooms] + list(req.home_rooms.values())))
+        self.room_index = {r: i for i, r in enumerate(self.rooms)}
+        self.divisions = list(dict.fromkeys(
+            [d for divs in req.divisions.values() for d in divs] + [g.div for g in genes]))
+        self.year_of = {d: year for year, divs in req.divisions.items() for d in divs}
+        self.div_index = {d: i for i, d in enumerate(self.divisions)}
+        self.batches = []
+        self.batch_index = {}
+
+        for g in genes:
+            g.div_id = self.div_index[g.div]
+            g.whole_div = "ALL" in g.batch_ids
+            g.batch_idx = tuple(self._intern_batch(g.div, b) for b in g.batch_ids if b != "ALL")
+            g.teacher_idx = tuple(self.teacher_index[t.id] for t in g.teachers_list if t.id in self.teacher_index)
+
+        self._index_rooms(req.resources)
+
+        slots_per_day, n_days = self.constants['SLOTS_PER_DAY'], self.constants['DAYS']
+        recess = self.constants['RECESS_INDEX']
+        self.recess_mask = 0
+        if 0 <= recess < slots_per_day:
+            for d in range(n_days):
+                self.recess_mask |= 1 << (d * slots_per_day + recess)
+        self._index_domains()
+        # Slots each teacher's shift rules out, as a week mask
+        self.teacher_blocked = []
+        for t in teachers:
+            mask = 0
+            for s in range(slots_per_day):
+                if not t.is_available(s, slots_per_day):
+                    for d in range(n_days):
+                        mask |= 1 << (d * slots_per_day + s)
+            self.teacher_blocked.append(mask)
+        # [bit] -> room ids out of service there
+        self.room_blocked_at = [0] * (n_days * slots_per_day)
+
+    def week_mask(self, days=None, slots=None):
+        """Week bits for ``days`` x ``slots`` (indices); None means all of them."""
+        slots_per_day = self.constants['SLOTS_PER_DAY']
+        mask = 0
+        for d in range(self.constants['DAYS']) if days is None else days:
+            for s in range(slots_per_day) if slots is None else slots:
+                mask |= 1 << (d * slots_per_day + s)
+        return mask
+
+    def block_teacher(self, teacher_id, mask):
+        self.teacher_blocked[self.teacher_index[teacher_id]] |= mask
+
+    def block_room(self, room, mask):
+        r_id = self.room_index[room]
+        bit = 0
+        while mask:
+            if mask & 1: self.room_blocked_at[bit] |= 1 << r_id
+            mask >>= 1
+            bit += 1
+
+    def _index_rooms(self, resources):
+        # Room candidates depend only on the gene, never on the slot being
+        # tried, so the pools and each lab subject's special rooms are
+        # resolved here once instead of inside the placement loop.
+        room_index = self.room_index
+        self.theory_pool = tuple(dict.fromkeys(room_index[r] for r in resources.theory_rooms))
+        reserved = {r for rooms in self.special_rooms.values() for r in rooms}
+        self.lab_pool = tuple(dict.fromkeys(room_index[r] for r in resources.lab_rooms if r not in reserved))
+        theory = set(self.theory_pool)
+        self.home_room = []
+        for d in self.divisions:
+            home = room_index.get(self.home_rooms.get(d), -1)
+            self.home_room.append(home if home in theory else -1)
+
+        special_keys = [(normalize_key(k), k) for k in self.special_rooms]
+        plans = {}
+        def plan_for(sub_name, gene_type):
+            if sub_name == 'PROJECT' or sub_name == 'LIBRARY':
+                return (ROOM_FALLBACK, self.theory_pool)
+            norm_sub = normalize_key(sub_name)
+            special_key = next((k for nk, k in special_keys if nk in norm_sub or norm_sub in nk), None)
+            if special_key:
+                return (ROOM_SPECIAL, tuple(room_index[r] for r in self.special_rooms[special_key]))
+            return (ROOM_POOL, self.theory_pool if gene_type == "MATHS_TUT" else self.lab_pool)
+
+        for g in self.genes:
+            if g.type in ["THEORY", "ELECTIVE"]: continue
+            plan = []
+            for sub_name in g.lab_subjects[:len(g.teachers_list)]:
+                key = (sub_name, g.type)
+                if key not in plans: plans[key] = plan_for(sub_name, g.type)
+                plan.append(plans[key])
+            g.room_plan = tuple(plan)
+
+    def _index_domains(self):
+        # Start positions and the genes whose bookings can rule them out
+        # (shared teacher, division, batch or sole special room), for the
+        # propagation in construct().
+        slots_per_day, n_days = self.constants['SLOTS_PER_DAY'], self.constants['DAYS']
+        for g in self.genes:
+            day_starts = 0
+            for s in allowed_starts(g, slots_per_day):
+                span = ((1 << g.duration) - 1) << s
+                if s + g.duration <= slots_per_day and not span & self.recess_mask:
+                    day_starts |= 1 << s
+            g.starts = sum(day_starts << (d * slots_per_day) for d in range(n_days))
+            g.sole_rooms = tuple(c[0] for kind, c in g.room_plan if kind == ROOM_SPECIAL and len(c) == 1)
+            g.slot_cost = slot_costs(g, slots_per_day)
+
+        by_teacher, by_batch, by_room = defaultdict(list), defaultdict(list), defaultdict(list)
+        whole, by_div = defaultdict(list), defaultdict(list)
+        for g in self.genes:
+            for t in g.teacher_idx: by_teacher[t].append(g.gid)
+            for b in g.batch_idx: by_batch[b].append(g.gid)
+            for r in g.sole_rooms: by_room[r].append(g.gid)
+            by_div[g.div_id].append(g.gid)
+            if g.whole_div: whole[g.div_id].append(g.gid)
+        self.neighbours = []
+        for g in self.genes:
+            near = set(by_div[g.div_id] if g.whole_div else whole[g.div_id])
+            for t in g.teacher_idx: near.update(by_teacher[t])
+            for b in g.batch_idx: near.update(by_batch[b])
+            for r in g.sole_rooms: near.update(by_room[r])
+            near.discard(g.gid)
+            self.neighbours.append(tuple(sorted(near)))
+
+    def _intern_batch(self, div, batch):
+        key = (div, batch)
+        if key not in self.batch_index:
+            self.batch_index[key] = len(self.batches)
+            self.batches.append(key)
+        return self.batch_index[key]
+
+    def parts(self):
+        """gids by year, largest year first; divisions outside ``req.divisions``
+        form a part of their own."""
+        parts = defaultdict(list)
+        for g in self.genes:
+            parts[self.year_of.get(g.div)].append(g.gid)
+        return sorted(parts.values(), key=len, reverse=True)
+
+    def subject(self, name):
+        idx = self.subject_index.get(name)
+        return self.subjects[idx] if idx is not None else None
+
+def validate_request(req):
+    if req.config.slots_per_day < 1:
+        raise HTTPException(status_code=422, detail="config.slots_per_day must be at least 1")
+    if not req.config.days:
+        raise HTTPException(status_code=422, detail="config.days must not be empty")
+    faculty_ids = [f.id for f in req.faculty]
+    if len(set(faculty_ids)) != len(faculty_ids):
+        raise HTTPException(status_code=422, detail="Duplicate faculty ids")
+    if not 1 <= req.solver.alternatives <= MAX_ALTERNATIVES:
+        raise HTTPException(status_code=422, detail=f"solver.alternatives must be between 1 and {MAX_ALTERNATIVES}")
+    if not 0 <= req.solver.min_difference <= 1:
+        raise HTTPException(status_code=422, detail="solver.min_difference must be between 0 and 1")
+    if req.solver.max_runs is not None and req.solver.max_runs < 1:
+        raise HTTPException(status_code=422, detail="solver.max_runs must be at least 1")
+    if req.solver.time_budget is not None and req.solver.time_budget <= 0:
+        raise HTTPException(status_code=422, detail="solver.time_budget must be positive")
+
+def compile_problem(req):
+    validate_request(req)
     teachers_map = {t.id: Teacher(t) for t in req.faculty}
     special_rooms = defaultdict(list)
     for r in req.rooms:
@@ -460,6 +1712,13 @@ async def generate_timetable(req: TimetableRequest):
     all_subjects_flat = []
     for year_list in req.subjects.values():
         all_subjects_flat.extend(year_list)
+    subject_by_name = {}
+    for s in all_subjects_flat:
+        subject_by_name.setdefault(s.name, s)
+
+    unknown = {a.teacher_id for a in req.allocations if a.teacher_id and a.teacher_id not in teachers_map}
+    if unknown:
+        logger.warning(f"Allocations name unknown teachers, scheduling them as TBA: {sorted(unknown)}")
 
     div_allocs = defaultdict(lambda: defaultdict(list))
     
@@ -495,7 +1754,7 @@ async def generate_timetable(req: TimetableRequest):
         
         for b_id, entries in batch_buckets.items():
             for entry in entries:
-                s_info = next((s for s in all_subjects_flat if s.name == entry['subject']), None)
+                s_info = subject_by_name.get(entry['subject'])
                 if not s_info and not entry['subject'].lower().endswith('tut'): 
                     continue 
 
@@ -543,7 +1802,7 @@ async def generate_timetable(req: TimetableRequest):
                         g_batches = [x['batch'] for x in chunk]
                         g_teachers = [x['teacher'] for x in chunk]
                         
-                        genes.append(Gene(div, "LAB", "Session", duration=2,
+                        genes.append(Gene(len(genes), div, "LAB", "Session", duration=2,
                                  teachers_list=g_teachers, 
                                  lab_subjects=g_subs, 
                                  batch_ids=g_batches))
@@ -552,14 +1811,14 @@ async def generate_timetable(req: TimetableRequest):
         for b_id, items in dur1_groups.items():
             for entry in items:
                 t = teachers_map.get(entry['teacher_id'], DummyTeacher())
-                genes.append(Gene(div, "MATHS_TUT", entry['subject'], duration=1,
+                genes.append(Gene(len(genes), div, "MATHS_TUT", entry['subject'], duration=1,
                                   teachers_list=[t], lab_subjects=[entry['subject']], batch_ids=[entry['batch']]))
 
         # B. THEORY
         electives = defaultdict(list)
         theory_list = []
         for item in types['THEORY']:
-            s_info = next((s for s in all_subjects_flat if s.name == item['subject']), None)
+            s_info = subject_by_name.get(item['subject'])
             if not s_info: continue
             t = teachers_map.get(item['teacher_id'], DummyTeacher())
             t.assign_load(s_info.weekly_load)
@@ -568,7 +1827,7 @@ async def generate_timetable(req: TimetableRequest):
         
         for sub_name, teacher, s_info in theory_list:
             for _ in range(s_info.weekly_load):
-                genes.append(Gene(div, "THEORY", sub_name, duration=1, 
+                genes.append(Gene(len(genes), div, "THEORY", sub_name, duration=1, 
                                   teachers_list=[teacher], batch_ids=["ALL"]))
         
         if electives:
@@ -576,53 +1835,468 @@ async def generate_timetable(req: TimetableRequest):
             elec_subjects = list(electives.keys())
             elec_teachers = []
             for sub in elec_subjects:
-                s_info = next((s for s in all_subjects_flat if s.name == sub), None)
+                s_info = subject_by_name.get(sub)
                 load = s_info.weekly_load if s_info else 3
                 max_load = max(max_load, load)
                 elec_teachers.append(electives[sub][0])
             for _ in range(max_load):
-                g = Gene(div, "ELECTIVE", "Elective Block", duration=1,
+                g = Gene(len(genes), div, "ELECTIVE", "Elective Block", duration=1,
                          teachers_list=elec_teachers, lab_subjects=elec_subjects, batch_ids=["ALL"])
                 genes.append(g)
 
-    # --- RUN SOLVER ---
-    schedule = solve(genes, req.config, req.resources, req.home_rooms, special_rooms)
+    if not req.resources.theory_rooms and any(g.type in ["THEORY", "ELECTIVE"] for g in genes):
+        raise HTTPException(status_code=422, detail="Theory sessions requested but no theory rooms configured")
+    return Problem(req, list(teachers_map.values()), all_subjects_flat, special_rooms, genes)
+
+# ==========================================
+# 5. REQUEST HANDLING
+# ==========================================
+
+def format_entry(g, slot, rooms):
+    entry = {
+        "slot": slot, "duration": g.duration, "type": g.type, "subject": g.subject,
+        "teacher": "TBA", "room": "TBA"
+    }
     
-    if not schedule:
-        raise HTTPException(status_code=500, detail="Unable to generate schedule")
+    if g.type in ["LAB", "MATHS_TUT"]:
+        entry["batches"] = []
+        for i, sub in enumerate(g.lab_subjects):
+            t_name = g.teachers_list[i].name if i < len(g.teachers_list) else "TBA"
+            r_name = rooms[i] if i < len(rooms) else "TBA"
+            b_id = g.batch_ids[i] if i < len(g.batch_ids) else "?"
+            entry["batches"].append({
+                "batch": f"B{b_id}", "subject": sub, "teacher": t_name, "room": r_name
+            })
+        entry["subject"] = " / ".join(dict.fromkeys(g.lab_subjects))
+        entry["teacher"] = "Multiple"
+        entry["room"] = "Multiple"
+        
+    elif g.type == "ELECTIVE":
+        entry["subject"] = " / ".join(g.lab_subjects)
+        entry["teacher"] = " / ".join([t.name for t in g.teachers_list])
+        entry["room"] = " / ".join(rooms)
+        
+    else: # THEORY
+        entry["teacher"] = g.teachers_list[0].name
+        entry["room"] = rooms[0] if rooms else "TBA"
+    return entry
 
+def format_timetable(genes, placements, days_lookup):
     output = defaultdict(lambda: defaultdict(list))
-    days_lookup = req.config.days
     
-    for g in schedule.genes:
-        if g.day == -1: continue
-        entry = {
-            "slot": g.slot, "duration": g.duration, "type": g.type, "subject": g.subject,
-            "teacher": "TBA", "room": "TBA"
+    for g in genes:
+        placement = placements.get(g.gid)
+        if placement is None: continue
+        day, slot, rooms = placement
+        output[g.div][days_lookup[day]].append(format_entry(g, slot, rooms))
+
+    return output
+
+def format_alternatives(problem, elite, days_lookup):
+    """The pool's timetables, best first, each with its score and how much
+    of it differs from the best."""
+    members = elite.members
+    return [{
+        "timetable": format_timetable(problem.genes, m.placements, days_lookup),
+        "score": m.score, "unplaced": len(m.unplaced), "gaps": m.gaps, "sparse_days": m.sparse_days,
+        "difference": round(elite.difference(members[0], m), 4)
+    } for m in members]
+
+def replay_cached(progress, cached):
+    progress.replay(cached["progress"])
+    progress.stats = cached["stats"]
+    progress.alternatives = cached.get("alternatives")
+    metrics.SOLVES.inc(1, "cached")
+    return cached["timetable"]
+
+def run_generation(req, progress=None, key=None, lookup=True):
+    if progress is None: progress = SolveProgress()
+    if key is None: key = request_key(req)
+    cached = result_cache.get(key) if lookup else None
+    if cached is not None: return replay_cached(progress, cached)
+
+    with metrics.PHASE_SECONDS.time("compile"):
+        problem = compile_problem(req)
+    progress.render = lambda placements: format_timetable(problem.genes, placements, req.config.days)
+    with metrics.PHASE_SECONDS.time("solve"):
+        schedule = solve(problem, req.solver, progress)
+    
+    if not schedule:
+        metrics.SOLVES.inc(1, "failed")
+        raise HTTPException(status_code=500, detail="Unable to generate schedule")
+    with metrics.PHASE_SECONDS.time("format"):
+        timetable = format_timetable(problem.genes, schedule.placements, req.config.days)
+    progress.stats = progress.statistics(problem.genes)
+    if progress.elite is not None:
+        progress.alternatives = format_alternatives(problem, progress.elite, req.config.days)
+    # A solve stopped early, or cut off by its caller's deadline, is only a
+    # best-so-far, not the answer to the request
+    cut_off = progress.deadline is not None and time.time() >= progress.deadline
+    if not progress.stop.is_set() and not cut_off:
+        result_cache.put(key, {"timetable": timetable, "progress": progress.snapshot(), "stats": progress.stats,
+                               "alternatives": progress.alternatives})
+    metrics.SOLVES.inc(1, "stopped" if progress.stop.is_set() else "solved")
+    return timetable
+
+REPAIR_LOCAL_SHARE = 0.4    # of RepairRequest.seconds, before the search may move anything
+REPAIR_POLISH_SHARE = 0.3   # of RepairRequest.seconds, to send moved sessions back once all fit
+REPAIR_EJECT_TRIES = 20
+# Far below ANCHOR_PENALTY, so an anchored session only moves for a real gain
+REPAIR_TEMPERATURES = (1e5, 1e4)
+# Above a gap, below an unplaced session: the polish never unseats anything to undo a move
+POLISH_ANCHOR_PENALTY = 90000000
+
+def entry_signature(entry):
+    # What a formatted entry says about its gene, rooms and slot aside
+    batches = tuple((b["batch"], b["subject"], b["teacher"]) for b in entry.get("batches", ()))
+    return (entry["type"], entry["duration"], None if batches else entry["subject"], entry["teacher"], batches)
+
+def entry_rooms(entry):
+    if entry.get("batches"): return tuple(b["room"] for b in entry["batches"])
+    return tuple(entry["room"].split(" / "))
+
+def apply_changes(problem, changes, days):
+    day_index = {d: i for i, d in enumerate(days)}
+    slots_per_day = problem.constants['SLOTS_PER_DAY']
+    for kind, items in (("teacher", changes.teachers), ("room", changes.rooms)):
+        for u in items:
+            if any(d not in day_index for d in u.days) or any(not 0 <= s < slots_per_day for s in u.slots):
+                raise HTTPException(status_code=422, detail=f"Unknown day or slot for {kind} {u.id}")
+            mask = problem.week_mask([day_index[d] for d in u.days] or None, u.slots or None)
+            if kind == "teacher":
+                if u.id not in problem.teacher_index:
+                    raise HTTPException(status_code=422, detail=f"Unknown teacher {u.id}")
+                problem.block_teacher(u.id, mask)
+            else:
+                if u.id not in problem.room_index:
+                    raise HTTPException(status_code=422, detail=f"Unknown room {u.id}")
+                problem.block_room(u.id, mask)
+
+def rooms_fit(schedule, day, slot, gene, rooms):
+    free = schedule.occ.free_rooms(day, slot, gene.duration)
+    ids = [schedule.problem.room_index[r] for r in rooms if r in schedule.problem.room_index]
+    return len(set(ids)) == len(ids) and all(free >> r & 1 for r in ids)
+
+def settle(schedule, unplaced, previous, rng):
+    # Sends sessions the search moved back to their old slot wherever that
+    # costs nothing, so the repair touches as little as it can.
+    genes = schedule.genes
+    for gid, (d, s) in previous.items():
+        placement = schedule.placements.get(gid)
+        if placement is None or placement[:2] == (d, s): continue
+        g = genes[gid]
+        before = evaluate(schedule, unplaced)[0]
+        mark = schedule.checkpoint()
+        schedule.unbook(g)
+        rooms = schedule.is_free(d, s, g) and get_rooms_for_gene(schedule, d, s, g, rng)
+        if rooms:
+            schedule.book(g, d, s, rooms)
+            if evaluate(schedule, unplaced)[0] >= before: continue
+        schedule.rollback(mark)
+
+def run_repair(rreq):
+    """Re-fits an earlier timetable to a changed request, moving as few sessions as it can."""
+    started = time.time()
+    req = rreq.request
+    days = req.config.days
+    with metrics.PHASE_SECONDS.time("compile"):
+        problem = compile_problem(req)
+    apply_changes(problem, rreq.changes, days)
+    genes = problem.genes
+    searching = time.perf_counter()
+
+    by_signature = defaultdict(list)
+    for g in genes:
+        by_signature[(g.div,) + entry_signature(format_entry(g, 0, ()))].append(g)
+    schedule = Schedule(problem)
+    slots_per_day = problem.constants['SLOTS_PER_DAY']
+    previous = {}               # gid -> (day, slot) it had before
+    for div, week in rreq.previous.items():
+        for day_name, entries in week.items():
+            if day_name not in days: continue
+            d = days.index(day_name)
+            for entry in entries:
+                if not 0 <= entry.slot < slots_per_day or entry.duration < 1:
+                    raise HTTPException(status_code=422, detail=f"Bad slot or duration in previous[{div}][{day_name}]")
+                entry = entry.model_dump(exclude_none=True)
+                matches = by_signature.get((div,) + entry_signature(entry))
+                if not matches: continue
+                g = matches.pop()
+                slot, rooms = entry["slot"], entry_rooms(entry)
+                previous[g.gid] = (d, slot)
+                if schedule.is_free(d, slot, g, strict_repetition_check=False) and rooms_fit(schedule, d, slot, g, rooms):
+                    schedule.book(g, d, slot, rooms)
+
+    rng = random.Random(rreq.seed)
+    displaced = [g for g in placement_order(genes, rng) if g.gid not in schedule.placements]
+    unplaced = [g for g in displaced if not _relocate(schedule, g, rng)]
+    # Short ejection chains move a handful of sessions, not a neighbourhood;
+    # of a few randomized attempts keep the one that seats most and moves least
+    ejected = bool(unplaced)
+    if unplaced:
+        mark, tried = schedule.checkpoint(), []
+        for _ in range(REPAIR_EJECT_TRIES):
+            left = repair_unplaced(schedule, unplaced, rng, strict_rep=False)
+            moved = sum(1 for gid, (d, s, _) in schedule.placements.items() if gid in previous and previous[gid] != (d, s))
+            tried.append((len(left), moved, left, dict(schedule.placements)))
+            schedule.rollback(mark)
+            if not left and moved == len(displaced): break
+        _, _, unplaced, placements = min(tried, key=lambda t: t[:2])
+        schedule = Schedule(problem)
+        for gid, (d, s, rooms) in placements.items():
+            schedule.book(genes[gid], d, s, rooms)
+    searched = widened = False
+    if unplaced:
+        searched = True
+        score, gaps, sparse_days = evaluate(schedule, unplaced)
+        start = RunResult(0, score, [g.gid for g in unplaced], gaps, sparse_days, dict(schedule.placements))
+        halt = threading.Event()
+        def on_improve(result):
+            if not result.unplaced: halt.set()
+        teachers = {t for g in unplaced for t in g.teacher_idx}
+        divisions = {g.div_id for g in unplaced}
+        neighbourhood = {g.gid for g in genes if g.div_id in divisions or teachers.intersection(g.teacher_idx)}
+        local_seconds = rreq.seconds * REPAIR_LOCAL_SHARE
+        start, moves = local_search(problem, start, local_seconds, "anneal", rng.getrandbits(64), halt, on_improve,
+                                    movable=neighbourhood, anchor=previous, temperatures=REPAIR_TEMPERATURES)
+        metrics.MOVES.inc(moves)
+        if start.unplaced:
+            widened = True
+            wide_seconds = rreq.seconds * (1 - REPAIR_LOCAL_SHARE - REPAIR_POLISH_SHARE)
+            start, moves = local_search(problem, start, wide_seconds, "anneal", rng.getrandbits(64),
+                                        halt, on_improve, anchor=previous, temperatures=REPAIR_TEMPERATURES)
+            metrics.MOVES.inc(moves)
+        unplaced = [genes[gid] for gid in start.unplaced]
+        schedule = Schedule(problem)
+        for gid, (d, s, rooms) in start.placements.items():
+            schedule.book(genes[gid], d, s, rooms)
+    if searched:
+        # The first timetable that fits is rarely the one that moves the least
+        moved = {gid for gid, (d, s, _) in schedule.placements.items() if gid in previous and previous[gid] != (d, s)}
+        if moved:
+            teachers = {t for gid in moved for t in genes[gid].teacher_idx}
+            divisions = {genes[gid].div_id for gid in moved}
+            around = {g.gid for g in genes if g.div_id in divisions or teachers.intersection(g.teacher_idx)}
+            score, gaps, sparse_days = evaluate(schedule, unplaced)
+            start = RunResult(0, score, [g.gid for g in unplaced], gaps, sparse_days, dict(schedule.placements))
+            seconds = min(rreq.seconds * REPAIR_POLISH_SHARE, max(0.0, started + rreq.seconds - time.time()))
+            start, moves = local_search(problem, start, seconds, "anneal", rng.getrandbits(64), movable=around,
+                                        anchor=previous, temperatures=REPAIR_TEMPERATURES,
+                                        anchor_penalty=POLISH_ANCHOR_PENALTY)
+            metrics.MOVES.inc(moves)
+            unplaced = [genes[gid] for gid in start.unplaced]
+            schedule = Schedule(problem)
+            for gid, (d, s, rooms) in start.placements.items():
+                schedule.book(genes[gid], d, s, rooms)
+    if ejected: settle(schedule, unplaced, previous, rng)
+    placements = schedule.placements
+    metrics.PHASE_SECONDS.observe(time.perf_counter() - searching, "repair")
+    with metrics.PHASE_SECONDS.time("format"):
+        timetable = format_timetable(genes, placements, days)
+
+    moved = [gid for gid, (d, s, _) in placements.items() if gid in previous and previous[gid] != (d, s)]
+    return {
+        "timetable": timetable,
+        "repair": {
+            "kept": sum(1 for gid in previous if gid in placements) - len(moved),
+            "moved": len(moved),
+            "added": sum(1 for gid in placements if gid not in previous),
+            "unplaced": len(unplaced),
+            "changed_divisions": sorted({genes[gid].div for gid in moved} | {g.div for g in unplaced}
+                                        | {genes[gid].div for gid in placements if gid not in previous}),
+            "widened": widened,
+            "elapsed": round(time.time() - started, 3)
         }
-        
-        if g.type in ["LAB", "MATHS_TUT"]:
-            entry["batches"] = []
-            for i, sub in enumerate(g.lab_subjects):
-                t_name = g.teachers_list[i].name if i < len(g.teachers_list) else "TBA"
-                r_name = g.assigned_rooms[i] if i < len(g.assigned_rooms) else "TBA"
-                b_id = g.batch_ids[i] if i < len(g.batch_ids) else "?"
-                entry["batches"].append({
-                    "batch": f"B{b_id}", "subject": sub, "teacher": t_name, "room": r_name
-                })
-            entry["subject"] = " / ".join(set(g.lab_subjects))
-            entry["teacher"] = "Multiple"
-            entry["room"] = "Multiple"
-            
-        elif g.type == "ELECTIVE":
-            entry["subject"] = " / ".join(g.lab_subjects)
-            entry["teacher"] = " / ".join([t.name for t in g.teachers_list])
-            entry["room"] = " / ".join(g.assigned_rooms)
-            
-        else: # THEORY
-            entry["teacher"] = g.teachers_list[0].name
-            entry["room"] = g.assigned_rooms[0]
-            
-        output[g.div][days_lookup[g.day]].append(entry)
+    }
 
-    return output
\ No newline at end of file
+# ==========================================
+# 6. API ENDPOINTS
+# ==========================================
+
+DISCONNECT_POLL = 0.1       # seconds between checks that a waiting client is still there
+DEADLINE_GRACE = 1.0        # past X-Deadline, for the solver's best-so-far to come back
+
+def tenant_of(request):
+    # Departments identify themselves; anonymous callers share by address,
+    # the original client's rather than the reverse proxy's
+    tenant = request.headers.get("x-tenant")
+    if tenant: return tenant
+    forwarded = request.headers.get("x-forwarded-for")
+    if forwarded: return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else None
+
+def deadline_of(request):
+    """When the caller stops waiting, from ``X-Deadline`` (seconds from now)."""
+    value = request.headers.get("x-deadline")
+    if value is None: return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="X-Deadline must be a number of seconds")
+    return time.time() + max(0.0, seconds)
+
+def submit_generation(req, request):
+    # Identical payloads already being solved join that job (single flight);
+    # the deadline only binds a solve this submission starts.
+    key = request_key(req)
+    progress = SolveProgress()
+    # Cache hits are answered here, never queued behind (or refused by) running solves
+    cached = result_cache.get(key)
+    if cached is not None: return job_manager.completed(replay_cached(progress, cached), progress)
+    progress.deadline = deadline_of(request)
+    return job_manager.submit(lambda job: run_generation(req, job.progress, key, lookup=False),
+                              progress=progress, key=key, tenant=tenant_of(request))
+
+async def wait_for_job(job, request):
+    """Waits for ``job`` until it ends, the client hangs up or its X-Deadline passes;
+    the latter two release the job."""
+    deadline = deadline_of(request)
+    done = asyncio.wrap_future(job.future)
+    while True:
+        try:
+            await asyncio.wait_for(asyncio.shield(done), timeout=DISCONNECT_POLL)
+            return
+        except asyncio.TimeoutError:
+            pass
+        if await request.is_disconnected():
+            job_manager.release(job)
+            raise HTTPException(status_code=499, detail="Client closed request")
+        # A solve bound by the deadline returns its best-so-far by then; only
+        # a job still queued (or not solving) is given up on.
+        if deadline is not None and time.time() >= deadline + DEADLINE_GRACE:
+            job_manager.release(job)
+            raise HTTPException(status_code=504, detail="Deadline passed before a timetable was ready")
+
+@app.exception_handler(QueueFull)
+async def queue_full(request: Request, exc: QueueFull):
+    metrics.SOLVES.inc(1, "rejected")
+    return JSONResponse(status_code=429, content={"detail": str(exc)},
+                        headers={"Retry-After": str(exc.retry_after)})
+
+def job_outcome(job):
+    if job.status == "cancelled":
+        raise HTTPException(status_code=409, detail="Job was cancelled")
+    if job.status == "failed":
+        raise HTTPException(status_code=job.error_status or 500, detail=job.error)
+    return job.result
+
+@app.post("/generate-timetable")
+async def generate_timetable(req: TimetableRequest, request: Request):
+    job = submit_generation(req, request)
+    await wait_for_job(job, request)
+    timetable = job_outcome(job)
+    if req.solver.stats: return {"timetable": timetable, "stats": job.progress.stats}
+    return timetable
+
+@app.post("/generate-alternatives")
+async def generate_alternatives(req: TimetableRequest, request: Request, k: int = 5,
+                                min_difference: Optional[float] = None):
+    """Up to ``k`` good timetables from one solve, each placing at least
+    ``min_difference`` of the sessions differently from every other."""
+    update = {"alternatives": k}
+    if min_difference is not None: update["min_difference"] = min_difference
+    req = req.model_copy(update={"solver": req.solver.model_copy(update=update)})
+    job = submit_generation(req, request)
+    await wait_for_job(job, request)
+    job_outcome(job)
+    response = {"alternatives": job.progress.alternatives or []}
+    if req.solver.stats: response["stats"] = job.progress.stats
+    return response
+
+@app.post("/repair-timetable")
+async def repair_timetable(rreq: RepairRequest, request: Request):
+    # A published timetable being patched jumps the queue of fresh solves
+    job = job_manager.submit(lambda job: run_repair(rreq), tenant=tenant_of(request), priority=True)
+    await wait_for_job(job, request)
+    return job_outcome(job)
+
+@app.get("/cache")
+async def cache_stats():
+    return dict(result_cache.stats(), coalesced=job_manager.coalesced)
+
+@app.get("/queue")
+async def queue_stats():
+    return job_manager.stats()
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.post("/jobs")
+async def submit_job(req: TimetableRequest, request: Request):
+    job = submit_generation(req, request)
+    # Its event stream dropping cancels it; a job only ever polled runs to the end
+    job_manager.hand_off(job)
+    return {"job_id": job.id, "status": job.status}
+
+def get_job_or_404(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    return get_job_or_404(job_id).summary()
+
+@app.get("/jobs/{job_id}/best")
+async def job_best(job_id: str):
+    job = get_job_or_404(job_id)
+    if job.status == "done": return job.result
+    best = job.progress.best_timetable()
+    if best is None:
+        raise HTTPException(status_code=404, detail="No schedule found yet")
+    return best
+
+@app.get("/jobs/{job_id}/result")
+async def job_result(job_id: str):
+    job = get_job_or_404(job_id)
+    if job.status not in ("done", "failed", "cancelled"):
+        return JSONResponse(status_code=202, content=job.summary())
+    return job_outcome(job)
+
+@app.post("/jobs/{job_id}/stop")
+async def stop_job(job_id: str):
+    """Ends the solve early; the job finishes with its best-so-far timetable."""
+    job = get_job_or_404(job_id)
+    job.progress.request_stop()
+    return job.summary()
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """Abandons the job (a queued one never runs, a running one stops, neither has
+    a result), unless identical submissions still wait on it."""
+    job = get_job_or_404(job_id)
+    job_manager.cancel(job)
+    return job.summary()
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request):
+    """Server-sent ``improved``/``progress`` events, then ``done``, ``failed`` or ``cancelled``;
+    a client dropping the stream releases the job."""
+    job = get_job_or_404(job_id)
+
+    async def stream():
+        seen, last_sent, finished = 0, 0.0, False
+        job_manager.watch(job)
+        try:
+            while True:
+                finished = job.status in ("done", "failed", "cancelled")
+                snap = job.progress.snapshot()
+                if snap["version"] != seen:
+                    seen = snap["version"]
+                    last_sent = time.time()
+                    yield f"event: improved\ndata: {json.dumps(snap)}\n\n"
+                elif not finished and time.time() - last_sent >= 1.0:
+                    last_sent = time.time()
+                    yield f"event: progress\ndata: {json.dumps(snap)}\n\n"
+                if finished:
+                    yield f"event: {job.status}\ndata: {json.dumps(job.summary())}\n\n"
+                    return
+                await asyncio.sleep(0.25)
+                if await request.is_disconnected(): return
+        finally:
+            if not finished: job_manager.release(job)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
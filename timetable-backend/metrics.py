@@ -0,0 +1,150 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+# ==========================================
+# Prometheus metrics, text exposition format
+# ==========================================
+#
+# Request latency, per-phase time and restart counts are always kept; they
+# are touched a handful of times per request or once per run. Hot-path
+# profiling (call counts and time inside the placement loop) wraps the
+# functions themselves, so it is only installed when TIMETABLE_PROFILE is
+# set and costs nothing otherwise.
+
+PROFILE = os.environ.get("TIMETABLE_PROFILE", "").lower() in ("1", "true", "yes", "on")
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+def _escape(v):
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(names, values):
+    if not names: return ""
+    pairs = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+def _num(x):
+    return repr(float(x)) if isinstance(x, float) else str(x)
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.values = {(): 0} if not self.labels else {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, *labels):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_labels(self.labels, key)} {_num(value)}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self.series = {}            # labels -> [per-bucket counts..., +Inf count, sum]
+        self.lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self.lock:
+            s = self.series.get(labels)
+            if s is None: s = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    s[i] += 1
+                    break
+            else:
+                s[len(self.buckets)] += 1
+            s[-1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.labels + ("le",)
+        with self.lock:
+            for key, s in sorted(self.series.items()):
+                running = 0
+                for bound, n in zip(self.buckets + ("+Inf",), s):
+                    running += n
+                    lines.append(f"{self.name}_bucket{_labels(names, key + (_num(bound) if bound != '+Inf' else bound,))} {running}")
+                lines.append(f"{self.name}_sum{_labels(self.labels, key)} {_num(s[-1])}")
+                lines.append(f"{self.name}_count{_labels(self.labels, key)} {running}")
+        return lines
+
+REQUEST_SECONDS = Histogram("timetable_request_duration_seconds", "HTTP request latency.", ("method", "path", "status"))
+PHASE_SECONDS = Histogram("timetable_phase_duration_seconds", "Time spent per solver phase.", ("phase",))
+RESTARTS = Counter("timetable_restarts_total", "Construction restarts executed.")
+MOVES = Counter("timetable_local_search_moves_total", "Local-search moves tried.")
+SOLVES = Counter("timetable_solves_total", "Generations by outcome.", ("outcome",))
+HOT_CALLS = Counter("timetable_hot_calls_total", "Calls to hot solver functions (TIMETABLE_PROFILE only).", ("function",))
+HOT_SECONDS = Counter("timetable_hot_seconds_total", "Time inside hot solver functions (TIMETABLE_PROFILE only).", ("function",))
+
+METRICS = [REQUEST_SECONDS, PHASE_SECONDS, RESTARTS, MOVES, SOLVES, HOT_CALLS, HOT_SECONDS]
+
+# ==========================================
+# Hot-path profiling
+# ==========================================
+
+_hot = {}       # function name -> [calls, seconds] not yet folded into the counters
+
+def timed(name, fn):
+    """``fn`` wrapped to count calls and time into the hot-path totals.
+
+    Totals are kept in plain lists and folded into the counters by
+    ``flush_hot``, so the wrapper itself never takes a lock; an increment
+    can be lost when two solves race on the same function, which is fine
+    for profiling.
+    """
+    cell = _hot.setdefault(name, [0, 0.0])
+    clock = time.perf_counter
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        started = clock()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            cell[0] += 1
+            cell[1] += clock() - started
+    return wrapper
+
+def take_hot():
+    """This process's hot-path totals since the last call, reset to zero."""
+    taken = {}
+    for name, cell in _hot.items():
+        if cell[0]:
+            taken[name] = (cell[0], cell[1])
+            cell[0] -= taken[name][0]
+            cell[1] -= taken[name][1]
+    return taken
+
+def add_hot(totals):
+    for name, (calls, seconds) in totals.items():
+        HOT_CALLS.inc(calls, name)
+        HOT_SECONDS.inc(seconds, name)
+
+def flush_hot():
+    add_hot(take_hot())
+
+def render():
+    flush_hot()
+    lines = []
+    for metric in METRICS:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
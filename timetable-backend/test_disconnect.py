@@ -0,0 +1,110 @@
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+import uvicorn
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "testing"))
+import fixtures
+import main
+
+# ==========================================
+# Clients that hang up on a real server
+# ==========================================
+#
+# Runs the app under uvicorn and talks to it over raw sockets, so closing
+# one is a real disconnect rather than whatever a test client simulates.
+
+SOLVE_SECONDS = 60      # far longer than any test waits
+
+def serve():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    server = uvicorn.Server(uvicorn.Config(main.app, log_level="warning"))
+    threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True).start()
+    while not server.started: time.sleep(0.05)
+    return server, sock.getsockname()[1]
+
+def send(port, method, path, body=None):
+    data = json.dumps(body).encode() if body is not None else b""
+    conn = socket.create_connection(("127.0.0.1", port))
+    conn.sendall(f"{method} {path} HTTP/1.1\r\nHost: test\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode() + data)
+    return conn
+
+def call(port, method, path, body=None):
+    conn = send(port, method, path, body)
+    response = b""
+    while chunk := conn.recv(65536): response += chunk
+    conn.close()
+    return json.loads(response.split(b"\r\n\r\n", 1)[1])
+
+def long_solve(seed):
+    return dict(fixtures.dataset_request(), solver={"seed": seed, "time_budget": SOLVE_SECONDS,
+                                                    "max_runs": 1000000})
+
+def wait_idle(port, seconds=5.0):
+    until = time.time() + seconds
+    while time.time() < until:
+        if call(port, "GET", "/queue")["running"] == 0: return True
+        time.sleep(0.1)
+    return False
+
+def test_hanging_up_cancels_a_blocking_solve():
+    server, port = serve()
+    try:
+        conn = send(port, "POST", "/generate-timetable", long_solve(101))
+        time.sleep(1.0)
+        assert call(port, "GET", "/queue")["running"] == 1
+        conn.close()
+        assert wait_idle(port)
+    finally:
+        server.should_exit = True
+
+def test_dropping_the_event_stream_cancels_a_job():
+    server, port = serve()
+    try:
+        job_id = call(port, "POST", "/jobs", long_solve(102))["job_id"]
+        conn = send(port, "GET", f"/jobs/{job_id}/events")
+        time.sleep(1.0)
+        assert call(port, "GET", f"/jobs/{job_id}")["status"] == "running"
+        conn.close()
+        assert wait_idle(port)
+        assert call(port, "GET", f"/jobs/{job_id}")["status"] == "cancelled"
+    finally:
+        server.should_exit = True
+
+def test_a_dropped_stream_leaves_other_waiters_their_solve():
+    server, port = serve()
+    try:
+        body = dict(long_solve(103), solver={"seed": 103, "time_budget": 3})
+        blocking = send(port, "POST", "/generate-timetable", body)
+        time.sleep(0.5)
+        # One identical job follows by event stream and drops it, another cancels
+        job_id = call(port, "POST", "/jobs", body)["job_id"]
+        conn = send(port, "GET", f"/jobs/{job_id}/events")
+        assert call(port, "POST", "/jobs", body)["job_id"] == job_id
+        time.sleep(0.5)
+        conn.close()
+        assert call(port, "POST", f"/jobs/{job_id}/cancel")["status"] == "running"
+        response = b""
+        while chunk := blocking.recv(65536): response += chunk
+        assert response.startswith(b"HTTP/1.1 200")
+    finally:
+        server.should_exit = True
+
+def test_a_resubmission_after_cancel_starts_afresh():
+    server, port = serve()
+    try:
+        body = long_solve(104)
+        job_id = call(port, "POST", "/jobs", body)["job_id"]
+        call(port, "POST", f"/jobs/{job_id}/cancel")
+        again = call(port, "POST", "/jobs", body)["job_id"]
+        assert again != job_id
+        call(port, "POST", f"/jobs/{again}/cancel")
+        assert wait_idle(port)
+    finally:
+        server.should_exit = True
@@ -0,0 +1,36 @@
+import threading
+
+import pytest
+
+from jobs import JobManager, QueueFull
+
+# ==========================================
+# JobManager queueing, without a solver
+# ==========================================
+
+def busy_manager(**kwargs):
+    # One worker held by a job that waits for ``gate``, so everything after it queues
+    manager, gate, started = JobManager(max_workers=1, **kwargs), threading.Event(), threading.Event()
+    manager.submit(lambda job: started.set() or gate.wait(), tenant="held")
+    started.wait()
+    return manager, gate
+
+def test_one_tenants_burst_leaves_room_for_others():
+    manager, gate = busy_manager(max_queue=2)
+    try:
+        for _ in range(2): manager.submit(lambda job: None, tenant="IT")
+        with pytest.raises(QueueFull):
+            manager.submit(lambda job: None, tenant="IT")
+        manager.submit(lambda job: None, tenant="CS")
+        assert manager.stats()["queued_by_tenant"] == {"IT": 2, "CS": 1}
+    finally:
+        gate.set()
+
+def test_the_queue_as_a_whole_stays_bounded():
+    manager, gate = busy_manager(max_queue=2, max_total=3)
+    try:
+        for tenant in ("IT", "IT", "CS"): manager.submit(lambda job: None, tenant=tenant)
+        with pytest.raises(QueueFull):
+            manager.submit(lambda job: None, tenant="ENTC")
+    finally:
+        gate.set()
@@ -0,0 +1,51 @@
+import json
+import os
+import sys
+
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "testing"))
+import fixtures
+import main
+
+# ==========================================
+# Requests the solver used to fail on
+# ==========================================
+
+client = TestClient(main.app)
+
+def solve(body, **solver):
+    return client.post("/generate-timetable", json=dict(body, solver=dict({"seed": 1, "max_runs": 5}, **solver)))
+
+def test_short_days_with_tutorials():
+    # Preferred starts such as the late tutorial slots lie past the end of an 8-slot day
+    body = fixtures.dataset_request(["SE"])
+    body["config"] = dict(body["config"], slots_per_day=8)
+    response = solve(body)
+    assert response.status_code == 200
+    slots = [e["slot"] + e["duration"] for week in response.json().values() for day in week.values() for e in day]
+    assert slots and max(slots) <= 8
+
+def test_solver_limits_must_be_positive():
+    body = fixtures.dataset_request(["SE"])
+    assert solve(body, max_runs=0).status_code == 422
+    assert solve(body, time_budget=0).status_code == 422
+
+def test_default_solves_keep_subjects_apart():
+    # No subject twice in a row in a division, however far into the budget the best run came
+    timetable = solve(fixtures.dataset_request(["SE"]), max_runs=None).json()
+    for week in timetable.values():
+        for day in week.values():
+            theory = sorted((e["slot"], e["subject"]) for e in day if e["type"] == "THEORY")
+            assert all(a[1] != b[1] or b[0] != a[0] + 1 for a, b in zip(theory, theory[1:]))
+
+def test_a_deadline_before_the_first_run_still_answers():
+    body = dict(fixtures.dataset_request(["SE"]), solver={"seed": 5})
+    response = client.post("/generate-timetable", json=body, headers={"X-Deadline": "0"})
+    assert response.status_code == 200 and response.json()
+
+def test_alternatives_are_all_different():
+    body = dict(fixtures.dataset_request(["SE"]), solver={"seed": 6, "max_runs": 40})
+    alternatives = client.post("/generate-alternatives?k=4&min_difference=0", json=body).json()["alternatives"]
+    timetables = [json.dumps(a, sort_keys=True) for a in alternatives]
+    assert len(timetables) > 1 and len(set(timetables)) == len(timetables)
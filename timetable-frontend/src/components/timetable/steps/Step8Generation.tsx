@@ -1,10 +1,30 @@
-import { useState } from 'react';
+import { MutableRefObject, useEffect, useRef, useState } from 'react';
 import { TimetableFormData, ResultsData } from '@/types/timetable';
 import { Button } from '@/components/ui/button';
 import { Card } from '@/components/ui/card';
-import { Play, Loader2, AlertTriangle } from 'lucide-react';
+import { Play, Loader2, AlertTriangle, Square } from 'lucide-react';
 import { toast } from '@/hooks/use-toast';
 
+const API_URL = import.meta.env.VITE_API_URL;
+
+// Snapshot pushed by the backend's /jobs/{id}/events stream
+interface SolverProgress {
+  runs: number;
+  runs_per_sec: number;
+  run?: number;
+  score?: number;
+  unplaced?: number;
+  gaps?: number;
+  sparse_days?: number;
+}
+
+// Leaving the step (or starting over) closes the event stream, which tells the
+// backend we no longer want the job; it stops unless someone else is waiting on it
+const abandonJob = (source: MutableRefObject<EventSource | null>) => {
+  source.current?.close();
+  source.current = null;
+};
+
 interface Step8GenerationProps {
   data: any;
   formData: TimetableFormData;
@@ -21,6 +41,12 @@ export const Step8Generation = ({
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState<string | null>(null);
   const [logs, setLogs] = useState<string[]>([]);
+  const [jobId, setJobId] = useState<string | null>(null);
+  const [progress, setProgress] = useState<SolverProgress | null>(null);
+  // The stream following the job still running on the backend, if any
+  const activeSource = useRef<EventSource | null>(null);
+
+  useEffect(() => () => abandonJob(activeSource), []);
 
   // --- TRANSFORM DATA FOR PYTHON BACKEND ---
   const transformDataForBackend = () => {
@@ -121,18 +147,65 @@ export const Step8Generation = ({
     };
   };
 
+  // Follow the job's event stream until it finishes, logging every improvement
+  const followJob = (id: string) => new Promise<SolverProgress | null>((resolve, reject) => {
+    let latest: SolverProgress | null = null;
+    const source = new EventSource(`${API_URL}/jobs/${id}/events`);
+    activeSource.current = source;
+
+    source.addEventListener('improved', (e) => {
+      latest = JSON.parse((e as MessageEvent).data);
+      setProgress(latest);
+      setLogs(prev => [...prev,
+        `Run ${latest!.run}: score ${latest!.score}, unplaced ${latest!.unplaced}, gaps ${latest!.gaps}, sparse days ${latest!.sparse_days}`
+      ]);
+    });
+    source.addEventListener('progress', (e) => {
+      latest = JSON.parse((e as MessageEvent).data);
+      setProgress(latest);
+    });
+    source.addEventListener('done', () => {
+      source.close();
+      resolve(latest);
+    });
+    source.addEventListener('failed', (e) => {
+      source.close();
+      reject(new Error(JSON.parse((e as MessageEvent).data).error || 'Generation failed'));
+    });
+    source.addEventListener('cancelled', () => {
+      source.close();
+      reject(new Error('Generation was cancelled'));
+    });
+    source.onerror = () => {
+      source.close();
+      reject(new Error('Lost connection to the solver'));
+    };
+  });
+
+  const handleStop = async () => {
+    if (!jobId) return;
+    setLogs(prev => [...prev, "Stopping early, keeping the best schedule so far..."]);
+    await fetch(`${API_URL}/jobs/${jobId}/stop`, { method: 'POST' });
+  };
+
   const handleRunAlgorithm = async () => {
+    abandonJob(activeSource);
     setLoading(true);
     setError(null);
+    setProgress(null);
     setLogs(["Preparing data structure...", "Connecting to Solver Engine..."]);
 
     try {
       const payload = transformDataForBackend();
       console.log("Sending Payload:", JSON.stringify(payload, null, 2)); // Debugging log
 
-      const response = await fetch(`${import.meta.env.VITE_API_URL}/generate-timetable`, {
+      const response = await fetch(`${API_URL}/jobs`, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
+        headers: {
+          'Content-Type': 'application/json',
+          // The backend queues fairly per department, not per (proxy) address
+          ...(formData.welcome.department && { 'X-Tenant': encodeURIComponent(formData.welcome.department) })
+        },
         body: JSON.stringify(payload)
       });
 
@@ -141,17 +214,24 @@ export const Step8Generation = ({
         throw new Error(`Server Error: ${errText}`);
       }
 
-      setLogs(prev => [...prev, "Algorithm Running... (Genetic Evolution in progress)", "Optimizing fitness score..."]);
-      
-      const result = await response.json();
+      const { job_id } = await response.json();
+      setJobId(job_id);
+      setLogs(prev => [...prev, "Algorithm Running...", "Optimizing fitness score..."]);
+
+      const final = await followJob(job_id);
+      const resultResponse = await fetch(`${API_URL}/jobs/${job_id}/result`);
+      if (!resultResponse.ok) {
+        throw new Error(`Server Error: ${await resultResponse.text()}`);
+      }
+      const result = await resultResponse.json();
       
       setLogs(prev => [...prev, "Solution Found!", "Processing Results..."]);
 
       // Update Result State
       onResultsUpdate({
-        totalGaps: 0, 
-        unplacedLectures: 0, 
-        fitnessScore: 9500, // Dummy score or return from backend
+        totalGaps: final?.gaps ?? 0, 
+        unplacedLectures: final?.unplaced ?? 0, 
+        fitnessScore: final?.score ?? 0,
         timetable: result
       });
 
@@ -170,6 +250,7 @@ export const Step8Generation = ({
       setLogs(prev => [...prev, `ERROR: ${err.message}`]);
     } finally {
       setLoading(false);
+      setJobId(null);
     }
   };
 
@@ -196,6 +277,18 @@ export const Step8Generation = ({
         </Button>
       )}
 
+      {loading && jobId && (
+        <div className="max-w-xl mx-auto mt-8 flex items-center justify-between gap-4 text-sm text-muted-foreground">
+          <span>
+            {progress ? `${progress.runs} runs · ${progress.runs_per_sec} runs/sec` : 'Starting solver...'}
+          </span>
+          <Button variant="outline" size="sm" onClick={handleStop}>
+            <Square className="w-4 h-4 mr-2" />
+            Stop &amp; keep best
+          </Button>
+        </div>
+      )}
+
       {(loading || logs.length > 0) && (
         <Card className="max-w-xl mx-auto mt-8 p-4 text-left bg-black/5 border-black/10">
           <div className="space-y-2 font-mono text-sm">